@@ -0,0 +1,179 @@
+"""
+Thread-safe pool of long-lived RabbitMQ connections/channels for publishing.
+
+pika's BlockingConnection is not thread-safe, so each pooled connection is
+checked out by one thread at a time. Connections are opened lazily up to
+`size`, the exchange/queue topology is declared once rather than on every
+publish, and a connection that fails is dropped and replaced on the retry.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+
+import pika.exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class _PooledChannel:
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.uses = 0
+
+    def is_open(self):
+        return self.connection.is_open and self.channel.is_open
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception as e:
+            logger.debug("Error closing pooled connection: %s", e)
+
+
+class ChannelPool:
+    def __init__(self, connection_factory, size=4, declare=None, confirm_delivery=False,
+                 acquire_timeout=5):
+        """
+        connection_factory: callable returning a new pika.BlockingConnection.
+        declare: optional callable(channel) that declares exchanges/queues.
+        confirm_delivery: enable publisher confirms, so publish() only returns
+        once the broker has accepted the message.
+        """
+        self.connection_factory = connection_factory
+        self.size = size
+        self.declare = declare
+        self.confirm_delivery = confirm_delivery
+        self.acquire_timeout = acquire_timeout
+        # LIFO keeps reusing the most recently used (warmest) connection
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._declared = False
+        self._stats = {'connections_created': 0, 'reuses': 0, 'publishes': 0,
+                       'publish_failures': 0, 'reconnects': 0}
+
+    def start(self):
+        """Opens the first connection and declares the topology up front."""
+        try:
+            with self.channel():
+                pass
+        except Exception as e:
+            logger.error("Could not open RabbitMQ publisher connection at startup: %s", e)
+
+    def _connect(self):
+        connection = self.connection_factory()
+        channel = connection.channel()
+        if self.confirm_delivery:
+            channel.confirm_delivery()
+        with self._lock:
+            declare = self.declare is not None and not self._declared
+            self._stats['connections_created'] += 1
+        if declare:
+            self.declare(channel)
+            with self._lock:
+                self._declared = True
+            logger.info("Declared RabbitMQ publisher topology")
+        return _PooledChannel(connection, channel)
+
+    def _acquire(self):
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open and self._idle.empty():
+                self._open += 1
+            else:
+                can_open = False
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        try:
+            entry = self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise PoolExhausted("No RabbitMQ channel free after %s seconds" % self.acquire_timeout)
+        try:
+            # Services heartbeats that arrived while idle and notices dropped sockets
+            entry.connection.process_data_events(time_limit=0)
+        except Exception as e:
+            logger.warning("Pooled RabbitMQ connection dropped while idle: %s", e)
+        if not entry.is_open():
+            self._discard(entry)
+            with self._lock:
+                self._open += 1
+                self._stats['reconnects'] += 1
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+        with self._lock:
+            self._stats['reuses'] += 1
+        return entry
+
+    def _discard(self, entry):
+        entry.close()
+        with self._lock:
+            self._open -= 1
+            # The broker may have restarted, so declare again on the next connection
+            self._declared = False
+
+    @contextmanager
+    def channel(self):
+        entry = self._acquire()
+        try:
+            yield entry.channel
+        except (pika.exceptions.NackError, pika.exceptions.UnroutableError):
+            # The broker refused the message but the channel is still usable
+            self._idle.put(entry)
+            raise
+        except Exception:
+            self._discard(entry)
+            raise
+        else:
+            entry.uses += 1
+            self._idle.put(entry)
+
+    def publish(self, exchange, routing_key, body, properties=None, retries=1):
+        """Publishes body, reconnecting and retrying if the connection was lost."""
+        for attempt in range(retries + 1):
+            try:
+                with self.channel() as channel:
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                          body=body, properties=properties)
+                with self._lock:
+                    self._stats['publishes'] += 1
+                return
+            except (pika.exceptions.NackError, pika.exceptions.UnroutableError, PoolExhausted):
+                with self._lock:
+                    self._stats['publish_failures'] += 1
+                raise
+            except Exception as e:
+                with self._lock:
+                    self._stats['publish_failures'] += 1
+                if attempt == retries:
+                    raise
+                logger.warning("Publish failed (%s), retrying on a new connection", e)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=self.size, open=self._open, idle=self._idle.qsize(),
+                        in_use=self._open - self._idle.qsize())
+
+    def close(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(entry)
@@ -0,0 +1,112 @@
+"""
+In-memory application state (the status message shown by the frontend).
+
+Reads never touch the database: /state is answered from memory and tagged
+with an ETag that changes on every update. Updates land in memory straight
+away and are persisted by a background thread at most `max_writes_per_second`
+times a second; bursts of updates in between are coalesced into one write of
+the latest state.
+"""
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    def __init__(self, initial, persist, max_writes_per_second=1.0):
+        """
+        initial: dict with the state loaded at startup.
+        persist: callable(state dict) writing the state to durable storage.
+        """
+        self.persist = persist
+        self.min_interval = 1.0 / max_writes_per_second if max_writes_per_second > 0 else 0.0
+        self._state = dict(initial)
+        # Per-process token, so a tag handed out before a restart never matches
+        self._token = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._persisted_version = 0
+        self._last_write = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.writes = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='state-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def snapshot(self):
+        """Returns (state dict, etag) for the current version."""
+        with self._cond:
+            return dict(self._state), self._etag()
+
+    def update(self, persist=True, **changes):
+        """
+        Applies changes in memory and, unless persist is False, schedules a
+        write; returns the new state. persist=False is for a process that only
+        mirrors state another process is writing.
+        """
+        with self._cond:
+            clean = self._persisted_version == self._version
+            self._state.update(changes)
+            self._version += 1
+            if not persist and clean:
+                self._persisted_version = self._version
+            self._cond.notify_all()
+            return dict(self._state)
+
+    def flush(self):
+        """Writes the latest state now if it hasn't been persisted yet."""
+        with self._cond:
+            if self._persisted_version == self._version:
+                return
+            state, version = dict(self._state), self._version
+        self._write(state, version)
+
+    def _etag(self):
+        return '%s-%d' % (self._token, self._version)
+
+    def _write(self, state, version):
+        try:
+            self.persist(state)
+        except Exception as e:
+            logger.error("Could not persist app state: %s", e)
+            with self._cond:
+                # Retried at the next allowed write, not in a busy loop
+                self._last_write = time.monotonic()
+            return
+        with self._cond:
+            self._persisted_version = max(self._persisted_version, version)
+            self._last_write = time.monotonic()
+            self.writes += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._persisted_version == self._version:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                # Let further updates pile up until the next write is allowed
+                delay = self._last_write + self.min_interval - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                state, version = dict(self._state), self._version
+            self._write(state, version)
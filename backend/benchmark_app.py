@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Load test for the Flask endpoints, run entirely in-process: RabbitMQ is the
+fake broker from local_fakes, HDFS and the SQLite databases live in a
+temporary directory (STORAGE_BACKEND=local, DATABASE_URI) and
+inference_worker answers with the stub model.
+Each endpoint is driven at every concurrency level in turn. /predict posts
+freshly generated JPEGs of --upload_size, so it goes through the same ingest
+route as real photos, and the fake broker encodes message properties the way
+pika does.
+
+    python benchmark_app.py --endpoints predict,state,csv_train --concurrency 1,8,32 --requests 200
+"""
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+import pika
+
+import inference_worker
+from benchmark_ingest import synthetic_jpeg
+from benchmark_worker import percentile
+from local_fakes import FakeBroker, StubPredictor
+from metrics import REGISTRY
+
+
+def write_csv(storage_root, path, rows, parts):
+    """A Spark-style directory of CSV part files, as read_merged_csv expects."""
+    directory = os.path.join(storage_root, path.lstrip('/'))
+    os.makedirs(directory)
+    per_part = (rows + parts - 1) // parts
+    for part in range(parts):
+        with open(os.path.join(directory, 'part-%05d.csv' % part), 'w') as f:
+            f.write('image_path,raw_prediction,predicted_class\n')
+            for i in range(part * per_part, min(rows, (part + 1) * per_part)):
+                f.write('/data/images/img_%07d.jpg,%.6f,%d\n' % (i, (i % 1000) / 1000.0, i % 2))
+
+
+def start_app(broker, workdir, args):
+    """Imports app.py against the fakes; it connects to RabbitMQ and storage at import time."""
+    os.environ.update({
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_ROOT': workdir,
+        'CSV_TRAIN_PATH': '/data/train_results',
+        'CSV_TEST_PATH': '/data/test_results',
+        'PREDICTION_CACHE_BACKEND': args.cache,
+        # Keep the users/state database and the sqlite cache out of the server's files
+        'DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'users.db'),
+        'PREDICTION_CACHE_PATH': os.path.join(workdir, 'prediction_cache.db'),
+    })
+    for path in ('/data/train_results', '/data/test_results'):
+        write_csv(workdir, path, args.csv_rows, args.csv_parts)
+    pika.BlockingConnection = broker.connection
+    import app
+    return app
+
+
+def upload_image(upload_size):
+    """A real JPEG, so /predict takes the same ingest route as a user's photo."""
+    width, height = upload_size
+    # effect_noise is random on every call, so no two uploads share a cache key
+    return synthetic_jpeg(width, height, 0)
+
+
+def make_request(endpoint, client, headers, n, upload=None):
+    if endpoint == 'predict':
+        data = {'file': (BytesIO(upload), 'bench_%d.jpg' % n)}
+        return client.post('/predict', headers=headers, data=data, content_type='multipart/form-data')
+    if endpoint == 'state':
+        return client.get('/state')
+    return client.get('/' + endpoint, headers=headers)
+
+
+def run_level(app, endpoint, concurrency, num_requests, headers, uploads):
+    latencies, errors = [], []
+    counter = iter(range(num_requests))
+    lock = threading.Lock()
+
+    def client_loop():
+        client = app.test_client()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            start_time = time.perf_counter()
+            response = make_request(endpoint, client, headers, n, uploads[n] if uploads else None)
+            response.get_data()  # drain streamed bodies such as the CSV
+            latencies.append(time.perf_counter() - start_time)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    start_time = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start_time
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--endpoints', default='predict,state,csv_train',
+                        help="Comma separated: predict, state, csv_train, csv_test.")
+    parser.add_argument('--concurrency', default='1,8,32', help="Concurrent clients to compare.")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and concurrency.")
+    parser.add_argument('--batch_window_ms', type=float, default=10)
+    parser.add_argument('--max_batch_size', type=int, default=32)
+    parser.add_argument('--call_overhead_ms', type=float, default=20,
+                        help="Stub model cost per forward pass.")
+    parser.add_argument('--per_image_ms', type=float, default=2,
+                        help="Stub model cost per image in a forward pass.")
+    parser.add_argument('--csv_rows', type=int, default=10000, help="Rows in each results CSV.")
+    parser.add_argument('--csv_parts', type=int, default=4, help="Part files per results CSV.")
+    parser.add_argument('--cache', choices=['none', 'memory', 'sqlite'], default='none',
+                        help="PREDICTION_CACHE_BACKEND for the app.")
+    parser.add_argument('--upload_size', default='640x480',
+                        help="WIDTHxHEIGHT of the JPEGs posted to /predict. Set INGEST_INLINE_MAX_BYTES=0 "
+                             "to load test the HDFS route instead of the inline one.")
+    args = parser.parse_args()
+    upload_size = tuple(map(int, args.upload_size.split('x')))
+    logging.disable(logging.INFO)  # the app logs every request at INFO
+
+    broker = FakeBroker()
+    workdir = tempfile.mkdtemp(prefix='app_bench_')
+    worker = inference_worker.InferenceWorker(
+        broker.connection(),
+        StubPredictor(call_overhead=args.call_overhead_ms / 1000.0, per_image=args.per_image_ms / 1000.0),
+        batch_window=args.batch_window_ms / 1000.0,
+        max_batch_size=args.max_batch_size
+    )
+    worker.declare_topology()
+    worker_thread = threading.Thread(target=worker.run, daemon=True)
+    worker_thread.start()
+    try:
+        app = start_app(broker, workdir, args)
+        token = app.app.test_client().post('/login', json={'username': 'admin', 'password': 'admin'})
+        headers = {'Authorization': 'Bearer ' + token.get_json()['access_token']}
+
+        print("%10s %6s %10s %10s %10s %10s %10s %7s" % (
+            'endpoint', 'conc', 'req/s', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'errors'))
+        for endpoint in args.endpoints.split(','):
+            for concurrency in map(int, args.concurrency.split(',')):
+                # Made up front, so encoding JPEGs doesn't compete with the app for the GIL
+                uploads = [upload_image(upload_size) for _ in range(args.requests)] if endpoint == 'predict' else None
+                r = run_level(app.app, endpoint, concurrency, args.requests, headers, uploads)
+                print("%10s %6d %10.1f %10.1f %10.1f %10.1f %10.1f %7d" % (
+                    endpoint, concurrency, r['throughput'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+                    r['mean_ms'], r['errors']))
+        routes = {route: REGISTRY.get_sample_value('prediction_dispatch_images_total', {'route': route}) or 0
+                  for route in ('inline', 'hdfs')}
+        print("images dispatched: %d inline, %d through HDFS" % (routes['inline'], routes['hdfs']))
+    finally:
+        worker.stop()
+        broker.wake()
+        worker_thread.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs throughput of the inference backends on the same images.
+
+Every backend scores the same preprocessed batches; throughput counts only
+the forward passes. Each backend is compared with the FP32 'keras' backend
+(agreement of the predicted class, largest score difference) and, when the
+CSV has a 'label' column, with the labels. The fastest backend whose
+agreement stays within --tolerance is reported at the end.
+
+    python benchmark_backends.py --model_path best_model --data_csv labelled.csv \\
+        --tflite dynamic=best_model_dynamic.tflite,int8=best_model_int8.tflite
+
+Without --model_path a small random model and synthetic JPEGs are used, and
+its dynamic-range and int8 conversions are benchmarked too.
+"""
+import argparse
+import csv
+import logging
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import convert_model
+import inference_backends
+
+
+def read_dataset(csv_path, limit):
+    paths, labels = [], []
+    with tf.io.gfile.GFile(csv_path, 'r') as f:
+        for row in csv.DictReader(f):
+            if not row.get('image_path'):
+                continue
+            paths.append(row['image_path'])
+            labels.append(int(row['label']) if row.get('label') not in (None, '') else None)
+            if len(paths) >= limit:
+                break
+    if any(label is None for label in labels):
+        labels = None
+    return paths, labels
+
+
+def load_batches(paths, image_size, batch_size):
+    batches = []
+    for start in range(0, len(paths), batch_size):
+        batches.append(tf.stack([inference_backends.preprocess_image(p, image_size)
+                                 for p in paths[start:start + batch_size]]))
+    return batches
+
+
+def run_backend(backend, batches, repeat):
+    backend(batches[0])  # warm-up: traces the function / allocates the interpreter
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        scores = np.concatenate([backend(batch) for batch in batches])
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return scores, best
+
+
+def synthetic_setup(workdir, num_images, image_size):
+    from benchmark_classify import make_dataset, make_model
+
+    csv_path = make_dataset(workdir, num_images, image_size)
+    model_path = make_model(workdir, image_size)
+    calibration = convert_model.calibration_paths(csv_path, 50)
+    tflite = {}
+    for quantization in ('dynamic', 'int8'):
+        tflite[quantization] = '%s/model_%s.tflite' % (workdir, quantization)
+        with open(tflite[quantization], 'wb') as f:
+            f.write(convert_model.convert(model_path, quantization, image_size, calibration))
+    return csv_path, model_path, tflite
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', default=None,
+                        help="Keras model file or SavedModel directory. Omit for a synthetic model.")
+    parser.add_argument('--data_csv', default=None,
+                        help="CSV with an 'image_path' column and optionally a 0/1 'label' column.")
+    parser.add_argument('--tflite', default='',
+                        help="Comma separated name=path list of converted models to compare.")
+    parser.add_argument('--image_size', default='224,224')
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tflite_threads', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help="Largest acceptable fraction of images whose class differs from 'keras'.")
+    args = parser.parse_args()
+    if bool(args.model_path) != bool(args.data_csv):
+        parser.error("--model_path and --data_csv go together")
+    logging.getLogger('model_cache').setLevel(logging.WARNING)
+    image_size = tuple(map(int, args.image_size.split(',')))
+
+    workdir = tempfile.mkdtemp(prefix='backend_bench_')
+    try:
+        if args.model_path:
+            csv_path, model_path = args.data_csv, args.model_path
+            tflite = dict(item.split('=', 1) for item in args.tflite.split(',') if item)
+        else:
+            csv_path, model_path, tflite = synthetic_setup(workdir, args.images, image_size)
+
+        paths, labels = read_dataset(csv_path, args.images)
+        batches = load_batches(paths, image_size, args.batch_size)
+        candidates = [('keras', 'keras', model_path), ('function', 'function', model_path)]
+        candidates += [('tflite:' + name, 'tflite', path) for name, path in sorted(tflite.items())]
+
+        print("%16s %10s %10s %12s %10s" % ('backend', 'images/s', 'agreement', 'max_abs_diff', 'accuracy'))
+        reference, results = None, []
+        for name, backend, path in candidates:
+            model = inference_backends.load_backend(path, backend, image_size, args.tflite_threads or None)
+            scores, elapsed = run_backend(model, batches, args.repeat)
+            if reference is None:
+                reference = scores
+            agreement = np.mean((scores >= 0.5) == (reference >= 0.5))
+            accuracy = np.mean((scores >= 0.5) == np.asarray(labels)) if labels else float('nan')
+            throughput = len(paths) / elapsed
+            print("%16s %10.1f %10.4f %12.5f %10.4f" % (
+                name, throughput, agreement, np.max(np.abs(scores - reference)), accuracy))
+            results.append((throughput, name, agreement))
+
+        eligible = [r for r in results if 1.0 - r[2] <= args.tolerance]
+        throughput, name, _ = max(eligible)
+        print("Fastest within tolerance %.4f: %s (%.1f images/s)" % (args.tolerance, name, throughput))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compares the 'rdd' and 'arrow' inference engines of classify_images on a
+synthetic dataset in Spark local mode: random JPEGs, a tiny Keras model and
+a CSV of their paths, all written to a temporary directory.
+
+    python benchmark_classify.py --images 2000 --cores 4 --repeat 3
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+from pyspark.sql import SparkSession
+
+import classify_images
+
+
+def make_dataset(workdir, num_images, image_size):
+    image_dir = os.path.join(workdir, 'images')
+    os.makedirs(image_dir)
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(num_images):
+        pixels = rng.integers(0, 256, size=image_size + (3,), dtype=np.uint8)
+        path = os.path.join(image_dir, 'img_%05d.jpg' % i)
+        tf.io.write_file(path, tf.io.encode_jpeg(pixels))
+        paths.append(path)
+
+    csv_path = os.path.join(workdir, 'images.csv')
+    with open(csv_path, 'w') as f:
+        f.write('image_path\n')
+        f.write('\n'.join(paths) + '\n')
+    return csv_path
+
+
+def make_model(workdir, image_size):
+    # Small enough that the engines' overheads, not the model, dominate
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=image_size + (3,)),
+        tf.keras.layers.Conv2D(4, 3, strides=4, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(1, activation='sigmoid'),
+    ])
+    model_path = os.path.join(workdir, 'model.keras')
+    model.save(model_path)
+    return model_path
+
+
+def run_engine(spark, engine, csv_path, model_path, extra_args):
+    args = classify_images.parse_args([
+        '--model_path', model_path,
+        '--data_csv', csv_path,
+        '--output_csv', 'unused',
+        '--engine', engine,
+    ] + extra_args)
+    df = spark.read.option("header", "true").csv(csv_path)
+    start_time = time.perf_counter()
+    # The noop sink runs the whole plan without paying for the output write
+    classify_images.classify(spark, df, args).write.format('noop').mode('overwrite').save()
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=1000)
+    parser.add_argument('--image_size', default='224,224')
+    parser.add_argument('--cores', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--arrow_max_records', type=int, default=1024)
+    args = parser.parse_args()
+    image_size = tuple(map(int, args.image_size.split(',')))
+
+    workdir = tempfile.mkdtemp(prefix='classify_bench_')
+    spark = (SparkSession.builder
+             .master('local[%d]' % args.cores)
+             .appName('ClassifyImagesBenchmark')
+             .getOrCreate())
+    try:
+        csv_path = make_dataset(workdir, args.images, image_size)
+        model_path = make_model(workdir, image_size)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for module in ('model_cache.py', 'inference_backends.py'):
+            spark.sparkContext.addPyFile(os.path.join(here, module))
+
+        extra_args = ['--image_size', args.image_size,
+                      '--batch_size', str(args.batch_size),
+                      '--arrow_max_records', str(args.arrow_max_records)]
+        print("%8s %10s %12s" % ('engine', 'best_s', 'images/s'))
+        for engine in ('rdd', 'arrow'):
+            # First run warms the executors' model cache and is not counted
+            run_engine(spark, engine, csv_path, model_path, extra_args)
+            best = min(run_engine(spark, engine, csv_path, model_path, extra_args)
+                       for _ in range(args.repeat))
+            print("%8s %10.2f %12.1f" % (engine, best, args.images / best))
+    finally:
+        spark.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
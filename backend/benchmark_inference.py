@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Per-image cost of classify_images' inference partition at several batch
+sizes, in Spark local mode with a single partition on a single core, so the
+numbers are one executor core's worth of work. Besides the wall time it
+reports the decode / preprocess / input_wait / predict split collected by
+the stage accumulators.
+
+    python benchmark_inference.py --batch_sizes 1,8,32,64 --output timings.json
+    python benchmark_inference.py --batch_sizes 1,8,32,64 --baseline timings.json
+
+With --baseline the run fails if any batch size got slower per image than
+the saved run by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from pyspark.sql import SparkSession
+
+import classify_images
+from benchmark_classify import make_dataset, make_model
+
+
+def run_batch_size(spark, df, model_path, batch_size, num_images, extra_args):
+    args = classify_images.parse_args([
+        '--model_path', model_path,
+        '--data_csv', 'unused',
+        '--output_csv', 'unused',
+        '--engine', 'rdd',
+        '--batch_size', str(batch_size),
+    ] + extra_args)
+    timers = classify_images.stage_timers(spark)
+    before = {name: acc.value for name, acc in timers.items()}
+    start_time = time.perf_counter()
+    classify_images.classify(spark, df, args).write.format('noop').mode('overwrite').save()
+    elapsed = time.perf_counter() - start_time
+    spent = {name: acc.value - before[name] for name, acc in timers.items()}
+
+    result = {'batch_size': batch_size, 'total_ms': elapsed * 1000.0 / num_images}
+    for stage in classify_images.INFERENCE_STAGES:
+        result[stage + '_ms'] = spent[stage] * 1000.0 / max(1, spent['images'])
+    return result
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {r['batch_size']: r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        old = baseline.get(r['batch_size'])
+        if old and r['total_ms'] > old['total_ms'] * (1.0 + tolerance):
+            regressions.append("batch_size %d: %.2f ms/image, was %.2f" % (
+                r['batch_size'], r['total_ms'], old['total_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_sizes', default='1,8,32,64')
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--image_size', default='224,224')
+    parser.add_argument('--model_path', default=None,
+                        help="Model to time instead of the tiny synthetic one.")
+    parser.add_argument('--input_pipeline', choices=['eager', 'tfdata'], default='eager')
+    parser.add_argument('--backend', choices=['keras', 'function', 'tflite'], default='keras')
+    parser.add_argument('--output', default=None, help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', default=None, help="JSON file from an earlier --output run.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown per image against --baseline, as a fraction.")
+    args = parser.parse_args()
+    image_size = tuple(map(int, args.image_size.split(',')))
+
+    workdir = tempfile.mkdtemp(prefix='inference_bench_')
+    spark = (SparkSession.builder
+             .master('local[1]')
+             .appName('InferencePartitionBenchmark')
+             .getOrCreate())
+    try:
+        csv_path = make_dataset(workdir, args.images, image_size)
+        model_path = args.model_path or make_model(workdir, image_size)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for module in ('model_cache.py', 'inference_backends.py'):
+            spark.sparkContext.addPyFile(os.path.join(here, module))
+        df = spark.read.option("header", "true").csv(csv_path).coalesce(1).cache()
+        df.count()
+
+        extra_args = ['--image_size', args.image_size, '--input_pipeline', args.input_pipeline,
+                      '--backend', args.backend]
+        # Loads the model into the Python worker, so no batch size pays for it
+        run_batch_size(spark, df, model_path, 1, args.images, extra_args)
+
+        results = []
+        print("%10s %10s %10s %10s %10s %10s" % (
+            'batch', 'total_ms', 'decode_ms', 'prep_ms', 'wait_ms', 'predict_ms'))
+        for batch_size in map(int, args.batch_sizes.split(',')):
+            r = run_batch_size(spark, df, model_path, batch_size, args.images, extra_args)
+            results.append(r)
+            print("%10d %10.2f %10.2f %10.2f %10.2f %10.2f" % (
+                batch_size, r['total_ms'], r['decode_ms'], r['preprocess_ms'], r['input_wait_ms'],
+                r['predict_ms']))
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        regressions = compare(results, args.baseline, args.tolerance) if args.baseline else []
+    finally:
+        spark.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for line in regressions:
+        print("Regression: " + line)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
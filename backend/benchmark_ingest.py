@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Bytes moved per prediction by the HDFS and the inline request routes.
+
+For each upload, the HDFS route writes the whole file to HDFS, the worker
+reads it back, and the request message carries only the path. The inline
+route (ingest.py) downscales the upload in the app and carries the result in
+the message, so nothing else crosses the network. Reported per resolution,
+averaged over --repeat images:
+
+    upload      - the uploaded JPEG
+    hdfs route  - HDFS write + worker read + request message
+    inline      - request message with a 'jpeg' or 'uint8' payload
+    ingest ms   - app-side decode + resize + encode, with and without
+                  Pillow's reduced-size JPEG decoding (draft mode)
+
+The app's INGEST_INLINE_MAX_BYTES / INGEST_MAX_PAYLOAD_BYTES limits are not
+applied here, so every upload is measured on both routes.
+
+Each upload is then scored by the worker's ModelPredictor through both
+routes, and the second table shows, per inline encoding, the fraction of
+images given the same class as through HDFS and the largest score
+difference. Without --model_path a small random model is used, which only
+shows that the plumbing works; pass the real model (and real photos) for
+numbers that say whether an encoding is safe to deploy.
+
+    python benchmark_ingest.py --sizes 640x480,1920x1080,4032x3024
+    python benchmark_ingest.py --images 'photos/*.jpg' --model_path best_model
+"""
+import argparse
+import base64
+import glob
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+
+import ingest
+
+
+def synthetic_jpeg(width, height, seed, quality=90):
+    image = Image.effect_noise((width, height), 20 + seed % 40).convert('RGB')
+    # Noise alone compresses far worse than a photo; a gradient underneath is closer
+    image = Image.blend(image, Image.linear_gradient('L').resize((width, height)).convert('RGB'), 0.7)
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+def full_decode(fileobj, image_size):
+    """ingest.downscale without draft mode: decodes every pixel of the upload."""
+    height, width = image_size
+    return Image.open(fileobj).convert('RGB').resize((width, height), Image.BILINEAR)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def measure(data, name, image_size, quality):
+    hdfs_message = len(json.dumps({'filename': name, 'hdfs_path': '/data/images/' + name}))
+    row = {'upload': len(data), 'hdfs route': 2 * len(data) + hdfs_message}
+
+    _, row['full decode ms'] = timed(full_decode, io.BytesIO(data), image_size)
+    for encoding in ingest.ENCODINGS:
+        inline, seconds = timed(ingest.prepare_inline, io.BytesIO(data), len(data), image_size, encoding,
+                                quality, float('inf'), float('inf'))
+        row['inline ' + encoding] = len(json.dumps(dict(inline, filename=name)))
+        row['ingest %s ms' % encoding] = seconds
+    for key in row:
+        if key.endswith(' ms'):
+            row[key] *= 1000.0
+    return row
+
+
+def route_agreement(predictor, workdir, uploads, image_size, quality):
+    """
+    {encoding: (fraction of matching classes, largest score difference)}
+    between the HDFS route and each inline encoding.
+    """
+    from inference_worker import InlineImage, predicted_class
+
+    paths = []
+    for name, data in uploads:
+        path = os.path.join(workdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    reference = predictor.predict(paths)
+
+    agreement = {}
+    for encoding in ingest.ENCODINGS:
+        images = []
+        for name, data in uploads:
+            inline = ingest.prepare_inline(io.BytesIO(data), len(data), image_size, encoding, quality,
+                                           float('inf'), float('inf'))
+            images.append(InlineImage(base64.b64decode(inline['image']), encoding, inline['shape'], name))
+        scores = predictor.predict(images)
+        same = sum(predicted_class(a) == predicted_class(b) for a, b in zip(reference, scores))
+        agreement[encoding] = (same / float(len(uploads)),
+                               max(abs(a - b) for a, b in zip(reference, scores)))
+    return agreement
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='320x240,640x480,1280x960,1920x1080,4032x3024',
+                        help="Comma separated WIDTHxHEIGHT list of synthetic uploads.")
+    parser.add_argument('--images', default=None,
+                        help="Glob of real JPEGs to measure instead of synthetic ones.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--image_size', default='224,224')
+    parser.add_argument('--quality', type=int, default=90)
+    parser.add_argument('--model_path', default=None,
+                        help="Model used to compare the routes' scores. Defaults to a small random model.")
+    parser.add_argument('--backend', choices=['keras', 'function', 'tflite'], default='keras')
+    args = parser.parse_args()
+    logging.getLogger('model_cache').setLevel(logging.WARNING)
+    image_size = tuple(map(int, args.image_size.split(',')))
+
+    groups = {}
+    if args.images:
+        for path in sorted(glob.glob(args.images)):
+            with open(path, 'rb') as f:
+                data = f.read()
+            with Image.open(io.BytesIO(data)) as image:
+                label = '%dx%d' % image.size
+            groups.setdefault(label, []).append((os.path.basename(path), data))
+    else:
+        for size in args.sizes.split(','):
+            width, height = map(int, size.split('x'))
+            groups[size] = [('%s_%d.jpg' % (size, i), synthetic_jpeg(width, height, i))
+                            for i in range(args.repeat)]
+
+    columns = ['upload', 'hdfs route', 'inline jpeg', 'inline uint8',
+               'full decode ms', 'ingest jpeg ms', 'ingest uint8 ms']
+    print("%-12s" % 'resolution' + ''.join("%16s" % c for c in columns))
+    for label, uploads in groups.items():
+        rows = [measure(data, name, image_size, args.quality) for name, data in uploads]
+        mean = {c: sum(row[c] for row in rows) / len(rows) for c in columns}
+        print("%-12s" % label + ''.join(
+            "%16.1f" % mean[c] if c.endswith(' ms') else "%16d" % mean[c] for c in columns))
+        print("%-12s%16s%15.1fx%15.1fx%15.1fx" % (
+            '', 'reduction', 1.0, mean['hdfs route'] / mean['inline jpeg'],
+            mean['hdfs route'] / mean['inline uint8']))
+
+    from inference_worker import ModelPredictor
+
+    workdir = tempfile.mkdtemp(prefix='ingest_bench_')
+    try:
+        model_path = args.model_path
+        if model_path is None:
+            from benchmark_classify import make_model
+            model_path = make_model(workdir, image_size)
+        predictor = ModelPredictor(model_path, image_size, backend=args.backend)
+
+        print()
+        print("%-12s" % 'resolution' + ''.join(
+            "%16s%16s" % (encoding + ' agree', encoding + ' max diff') for encoding in ingest.ENCODINGS))
+        for label, uploads in groups.items():
+            agreement = route_agreement(predictor, workdir, uploads, image_size, args.quality)
+            print("%-12s" % label + ''.join(
+                "%15.1f%%%16.4f" % (agreement[e][0] * 100, agreement[e][1]) for e in ingest.ENCODINGS))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Throughput/latency benchmark for inference_worker against the in-process
+fake broker and stub model from local_fakes.
+
+    python benchmark_worker.py --clients 16 --requests 50 --windows 0,5,10,20
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+import uuid
+
+import pika
+
+import inference_worker
+from local_fakes import FakeBroker, StubPredictor
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_client(broker, client_id, num_requests, latencies):
+    channel = broker.connection().channel()
+    reply_queue = 'bench_reply_%d' % client_id
+    channel.queue_declare(queue=reply_queue)
+    for i in range(num_requests):
+        correlation_id = str(uuid.uuid4())
+        body = json.dumps({'filename': 'img_%d_%d.jpg' % (client_id, i),
+                           'hdfs_path': '/data/images/img_%d_%d.jpg' % (client_id, i)})
+        start_time = time.perf_counter()
+        channel.basic_publish(exchange=inference_worker.EXCHANGE_NAME,
+                              routing_key=inference_worker.REQUEST_ROUTING_KEY,
+                              body=body,
+                              properties=pika.BasicProperties(correlation_id=correlation_id,
+                                                              reply_to=reply_queue))
+        while True:
+            broker.wait([reply_queue], timeout=10)
+            method, properties, _ = channel.basic_get(queue=reply_queue)
+            if method is None:
+                raise RuntimeError("No reply within 10 seconds")
+            if properties.correlation_id == correlation_id:
+                break
+        latencies.append(time.perf_counter() - start_time)
+
+
+def run_benchmark(batch_window, max_batch_size, clients, num_requests, call_overhead, per_image):
+    broker = FakeBroker()
+    predictor = StubPredictor(call_overhead=call_overhead, per_image=per_image)
+    worker = inference_worker.InferenceWorker(broker.connection(), predictor,
+                                              batch_window=batch_window,
+                                              max_batch_size=max_batch_size)
+    worker.declare_topology()
+    worker_thread = threading.Thread(target=worker.run, daemon=True)
+    worker_thread.start()
+
+    latencies = []
+    threads = [threading.Thread(target=run_client, args=(broker, c, num_requests, latencies))
+               for c in range(clients)]
+    start_time = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start_time
+
+    worker.stop()
+    broker.wake()
+    worker_thread.join()
+    return {
+        'window_ms': batch_window * 1000,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'avg_batch': worker.requests / max(1, worker.batches),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help="Requests per client.")
+    parser.add_argument('--windows', default='0,5,10,20', help="Batch windows to compare, in ms.")
+    parser.add_argument('--max_batch_size', type=int, default=32)
+    parser.add_argument('--call_overhead_ms', type=float, default=20,
+                        help="Stub model cost per forward pass.")
+    parser.add_argument('--per_image_ms', type=float, default=2,
+                        help="Stub model cost per image in a forward pass.")
+    args = parser.parse_args()
+    logging.getLogger('inference_worker').setLevel(logging.WARNING)
+
+    print("%10s %12s %10s %10s %10s %10s" % ('window_ms', 'req/s', 'p50_ms', 'p95_ms', 'mean_ms', 'avg_batch'))
+    for window in args.windows.split(','):
+        r = run_benchmark(float(window) / 1000.0, args.max_batch_size, args.clients, args.requests,
+                          args.call_overhead_ms / 1000.0, args.per_image_ms / 1000.0)
+        print("%10.1f %12.1f %10.1f %10.1f %10.1f %10.1f" % (
+            r['window_ms'], r['throughput'], r['p50_ms'], r['p95_ms'], r['mean_ms'], r['avg_batch']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,101 +1,528 @@
 #!/usr/bin/env python3
 import argparse
+import heapq
+import logging
+import math
+import time
+
 import tensorflow as tf
 import numpy as np
 
 from pyspark.sql import SparkSession, Row
+from pyspark.sql import functions as F
 from pyspark.sql.functions import col
+from pyspark.sql.types import StructType, StructField, StringType, DoubleType, IntegerType
 
-def main():
+# Explicit output schema, so Spark never has to infer it from the results
+RESULT_SCHEMA = StructType([
+    StructField('image_path', StringType(), False),
+    StructField('raw_prediction', DoubleType(), True),
+    StructField('predicted_class', IntegerType(), True),
+])
+RESULT_COLUMNS = [field.name for field in RESULT_SCHEMA.fields]
+
+# Seconds spent in each stage of inference_partition, summed over all tasks.
+# 'input_wait' is the tfdata pipeline's equivalent of decode + preprocess:
+# those run inside tf.data, overlapped with predict, so only the time spent
+# waiting for the next batch is visible.
+INFERENCE_STAGES = ('decode', 'preprocess', 'input_wait', 'predict')
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_stage_timers = None
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--model_path', required=True,
                         help="HDFS path where the best model is stored (SavedModel format).")
     parser.add_argument('--data_csv', required=True,
                         help="HDFS path to CSV with a column 'image_path'.")
     parser.add_argument('--output_csv', required=True,
-                        help="HDFS directory path to store classification results (CSV).")
+                        help="HDFS directory path to store classification results (CSV or Parquet part files, see --output_format).")
     parser.add_argument('--image_size', default='224,224',
                         help="Target (height,width) for image resizing (match your model). e.g. '224,224' or '299,299'.")
     parser.add_argument('--num_partitions', type=int, default=0,
-                        help="Optional: coalesce or repartition the DataFrame to this number of partitions. 0 means do nothing.")
-    args = parser.parse_args()
+                        help="Optional: coalesce or repartition the DataFrame to this number of partitions. 0 means do nothing. Used by --partitioning fixed.")
+    parser.add_argument('--partitioning', choices=['fixed', 'auto', 'size'], default='fixed',
+                        help="'fixed' uses --num_partitions. 'auto' spreads the rows evenly over a partition count derived from the row count, the executor cores and --images_per_task. 'size' does the same but balances partitions by image file size.")
+    parser.add_argument('--images_per_task', type=int, default=256,
+                        help="Target number of images per task for --partitioning auto/size.")
+    parser.add_argument('--size_column', default=None,
+                        help="Optional column of --data_csv holding file sizes in bytes, used by --partitioning size instead of stat-ing every image.")
+    parser.add_argument('--batch_size', type=int, default=32,
+                        help="Number of images stacked into a single forward pass on the executors. 1 means one image per call.")
+    parser.add_argument('--input_pipeline', choices=['eager', 'tfdata'], default='eager',
+                        help="'eager' decodes images one by one before each batch. 'tfdata' decodes in parallel with tf.data and prefetches batches while the model runs.")
+    parser.add_argument('--num_parallel_calls', type=int, default=0,
+                        help="Number of images decoded in parallel by the 'tfdata' pipeline. 0 means let tf.data autotune.")
+    parser.add_argument('--prefetch_batches', type=int, default=2,
+                        help="Number of batches the 'tfdata' pipeline prepares ahead of inference. 0 means let tf.data autotune.")
+    parser.add_argument('--backend', choices=['keras', 'function', 'tflite'], default='keras',
+                        help="Inference backend (see inference_backends.py). 'tflite' expects --model_path to be a .tflite file from convert_model.py.")
+    parser.add_argument('--tflite_threads', type=int, default=0,
+                        help="Threads used by each TFLite interpreter. 0 lets TFLite decide.")
+    parser.add_argument('--model_cache_size', type=int, default=2,
+                        help="Maximum number of model versions kept in memory by each executor Python worker.")
+    parser.add_argument('--engine', choices=['arrow', 'rdd'], default='rdd',
+                        help="'rdd' uses mapPartitions over Python Row objects. 'arrow' runs inference with mapInPandas over Arrow batches and needs pandas and pyarrow on the driver and every executor.")
+    parser.add_argument('--arrow_max_records', type=int, default=0,
+                        help="Rows per Arrow batch handed to the 'arrow' engine (spark.sql.execution.arrow.maxRecordsPerBatch), and so per result batch it returns. Forward passes are still --batch_size images. 0 keeps Spark's setting.")
+    parser.add_argument('--output_format', choices=['csv', 'parquet'], default='csv',
+                        help="Format of the part files written to --output_csv.")
+    parser.add_argument('--write_mode', choices=['parallel', 'single'], default='parallel',
+                        help="'parallel' writes one part file per partition. 'single' coalesces to one partition first (serial, the old behaviour).")
+    parser.add_argument('--merge_csv', default=None,
+                        help="Optional HDFS file path: after a parallel CSV write, concatenate the part files into this single CSV (one header).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only classify images not already in --output_csv for this model version, and append their results.")
+    parser.add_argument('--model_version', default=None,
+                        help="Model version recorded with incremental results. Defaults to the model path plus its modification time.")
+    parser.add_argument('--change_column', default=None,
+                        help="Optional column of --data_csv (e.g. a modification time or checksum) that marks an image as changed when it differs.")
+    parser.add_argument('--chunk_rows', type=int, default=10000,
+                        help="Incremental runs append results in chunks of about this many images, so an interrupted run resumes from the last finished chunk.")
+    args = parser.parse_args(argv)
+    if args.merge_csv and args.output_format != 'csv':
+        parser.error("--merge_csv needs --output_format csv")
+    return args
+
+def auto_partition_count(rows, cores, images_per_task):
+    """Enough partitions for ~images_per_task each, rounded up to whole waves of cores."""
+    num_partitions = max(1, int(math.ceil(rows / float(max(1, images_per_task)))))
+    num_partitions = int(math.ceil(num_partitions / float(cores))) * cores
+    return max(1, min(num_partitions, rows))
+
+def file_sizes(rows_iter):
+    import tensorflow as tf  # ensure TF is available on executors
+    for row in rows_iter:
+        if not row.image_path:
+            continue
+        try:
+            size = tf.io.gfile.stat(row.image_path).length
+        except Exception:
+            size = 0
+        yield row.image_path, size
+
+def size_balanced_partitions(spark, df, args, cores):
+    """
+    Spreads images over partitions so that each gets about the same number of
+    bytes: largest files first, each to the currently lightest partition.
+    The path list is small, so the packing itself runs on the driver.
+    """
+    if args.size_column:
+        sizes = (df.where(col('image_path').isNotNull() & (col('image_path') != ''))
+                   .select('image_path', col(args.size_column).cast('long'))
+                   .rdd.map(tuple))
+    else:
+        sizes = df.select('image_path').rdd.mapPartitions(file_sizes)
+    items = [(path, size or 0) for path, size in sizes.collect()]
+    if not items:
+        return df.select('image_path')
     
+    num_partitions = auto_partition_count(len(items), cores, args.images_per_task)
+    loads = [(0, p) for p in range(num_partitions)]
+    assigned = []
+    for path, size in sorted(items, key=lambda item: -item[1]):
+        load, partition = heapq.heappop(loads)
+        assigned.append((partition, path))
+        heapq.heappush(loads, (load + size, partition))
+    
+    partition_bytes = sorted(load for load, _ in loads)
+    logger.info("Partitioning: size, %d images (%d bytes), %d cores, target %d images/task -> "
+                "%d partitions of %d-%d bytes", len(items), sum(partition_bytes), cores,
+                args.images_per_task, num_partitions, partition_bytes[0], partition_bytes[-1])
+    
+    rdd = (spark.sparkContext.parallelize(assigned, num_partitions)
+           .partitionBy(num_partitions, lambda partition: partition)
+           .map(lambda item: Row(image_path=item[1])))
+    return spark.createDataFrame(rdd, schema=StructType([StructField('image_path', StringType(), False)]))
+
+def plan_partitions(spark, df, args):
+    """Returns df split for inference as --partitioning asks, logging the chosen plan."""
+    if args.partitioning == 'fixed':
+        if args.num_partitions > 0:
+            current = df.rdd.getNumPartitions()
+            # coalesce can only merge partitions; growing needs a shuffle
+            if args.num_partitions > current:
+                df = df.repartition(args.num_partitions)
+            else:
+                df = df.coalesce(args.num_partitions)
+            logger.info("Partitioning: fixed, %d -> %d partitions", current, args.num_partitions)
+        return df
+    
+    cores = spark.sparkContext.defaultParallelism
+    if args.partitioning == 'size':
+        return size_balanced_partitions(spark, df, args, cores)
+    
+    rows = df.count()
+    num_partitions = auto_partition_count(rows, cores, args.images_per_task)
+    logger.info("Partitioning: auto, %d images, %d cores, target %d images/task -> "
+                "%d partitions of %d-%d images", rows, cores, args.images_per_task,
+                num_partitions, rows // num_partitions, int(math.ceil(rows / float(num_partitions))))
+    # Round-robin repartition gives every partition the same number of rows
+    return df.repartition(num_partitions)
+
+def stage_timers(spark):
+    """
+    Spark accumulators for the per-stage timings, shared by every classify()
+    call of this driver. Tasks that are retried are counted again.
+    """
+    global _stage_timers
+    if _stage_timers is None:
+        sc = spark.sparkContext
+        _stage_timers = {stage: sc.accumulator(0.0) for stage in INFERENCE_STAGES}
+        _stage_timers['images'] = sc.accumulator(0)
+        _stage_timers['errors'] = sc.accumulator(0)
+    return _stage_timers
+
+def log_stage_timings(timers):
+    images = timers['images'].value
+    if not images:
+        return
+    logger.info("Inference over %d images (%d unreadable): %s", images, timers['errors'].value,
+                ', '.join("%s %.2f ms/image (%.1f s)" % (stage, timers[stage].value * 1000.0 / images,
+                                                          timers[stage].value)
+                          for stage in INFERENCE_STAGES if timers[stage].value))
+
+def classify(spark, df, args):
+    """
+    Runs the model over the 'image_path' column of df and returns a DataFrame
+    with RESULT_SCHEMA. Nothing is computed until the result is written.
+    """
     # Parse image size
     height, width = map(int, args.image_size.split(','))
     target_size = (height, width)
     
-    # 1. Start Spark
-    spark = SparkSession.builder.appName("DistributedImageClassification").getOrCreate()
-    
-    # 2. Read the CSV from HDFS (must have at least one column: 'image_path')
-    df = spark.read.option("header", "true").csv(args.data_csv)
-    
     # If needed, reduce or increase partitions for better performance
-    if args.num_partitions > 0:
-        df = df.coalesce(args.num_partitions)
+    df = plan_partitions(spark, df, args)
     
     # 3. Broadcast the model path + other constants to all executors
     bc_model_path = spark.sparkContext.broadcast(args.model_path)
     bc_target_size = spark.sparkContext.broadcast(target_size)
+    bc_batch_size = spark.sparkContext.broadcast(max(1, args.batch_size))
+    bc_model_cache_size = spark.sparkContext.broadcast(args.model_cache_size)
+    bc_backend = spark.sparkContext.broadcast((args.backend, args.tflite_threads or None))
+    timers = stage_timers(spark)
+    bc_pipeline = spark.sparkContext.broadcast({
+        'input_pipeline': args.input_pipeline,
+        'num_parallel_calls': args.num_parallel_calls,
+        'prefetch_batches': args.prefetch_batches,
+    })
     
-    # 4. Define a function that runs inference over all rows in a partition
-    def inference_partition(rows_iter):
+    # 4. Define a function that runs inference over the images of a partition
+    def run_inference(image_paths):
         """
-        rows_iter: An iterator of Row objects, each presumably with 'image_path'.
-        We'll load the model once per partition, then run inference on each image.
+        image_paths: An iterator of non-empty image paths.
+        The model comes from the executor's model cache, so it is only loaded once
+        per worker process, then we run inference on fixed-size batches of images,
+        yielding one (image_path, raw_prediction, predicted_class) tuple per image
+        in input order.
         """
         import tensorflow as tf  # ensure TF is available on executors
+        import inference_backends  # shipped with --py-files, with model_cache.py
         
         model_path = bc_model_path.value
         target_h, target_w = bc_target_size.value
+        batch_size = bc_batch_size.value
+        pipeline = bc_pipeline.value
+        backend, num_threads = bc_backend.value
         
-        # Load the model once per partition
+        # Reuse the backend loaded by an earlier partition on this worker if any
         # If your TF build supports HDFS, it can load directly from hdfs://...
-        model = tf.keras.models.load_model(model_path)
+        model = inference_backends.get_backend(model_path, backend, (target_h, target_w),
+                                               num_threads, max_models=bc_model_cache_size.value)
         
-        results = []
-        for row in rows_iter:
-            image_path = row.image_path
-            if not image_path:
-                continue
-            
-            # Preprocess the image (single example). You could also batch them.
+        def load_image(image_path):
             image = tf.io.read_file(image_path)
             image = tf.image.decode_jpeg(image, channels=3)
             image = tf.image.resize(image, (target_h, target_w))
             # Use the same preprocessing you did in training (e.g., ResNet50)
+            return tf.keras.applications.resnet50.preprocess_input(image)
+        
+        def timed_load_image(image_path):
+            # load_image split in two, so decode and preprocess are timed apart
+            start_time = time.perf_counter()
+            image = tf.image.decode_jpeg(tf.io.read_file(image_path), channels=3)
+            decoded_time = time.perf_counter()
+            image = tf.image.resize(image, (target_h, target_w))
             image = tf.keras.applications.resnet50.preprocess_input(image)
-            
-            # Expand dims -> shape [1, h, w, c]
-            image = tf.expand_dims(image, axis=0)
-            
-            # Predict
-            pred = model.predict(image)[0][0]
+            timers['decode'].add(decoded_time - start_time)
+            timers['preprocess'].add(time.perf_counter() - decoded_time)
+            return image
+        
+        def timed_predict(images):
+            start_time = time.perf_counter()
+            preds = model(images)
+            timers['predict'].add(time.perf_counter() - start_time)
+            timers['images'].add(len(preds))
+            return preds
+        
+        def make_row(image_path, pred):
             # If it's a binary classifier, threshold at 0.5 for class
-            predicted_class = int(pred >= 0.5)
+            return image_path, float(pred), int(pred >= 0.5)
+        
+        def error_row(image_path):
+            # NaN / -1 marks an image that could not be read or decoded.
+            timers['images'].add(1)
+            timers['errors'].add(1)
+            return image_path, float('nan'), -1
+        
+        def predict_batch(image_paths):
+            # Stack -> shape [n, h, w, c] and run a single forward pass.
+            # Calling the model directly avoids the per-call setup of model.predict.
+            images, loaded = [], []
+            for image_path in image_paths:
+                try:
+                    images.append(timed_load_image(image_path))
+                    loaded.append(True)
+                except (tf.errors.OpError, ValueError):
+                    # Same error row as the tfdata pipeline gives an unreadable image
+                    loaded.append(False)
+            preds = iter(timed_predict(tf.stack(images)) if images else [])
+            for image_path, ok in zip(image_paths, loaded):
+                yield make_row(image_path, next(preds)) if ok else error_row(image_path)
+        
+        def tfdata_predictions(image_paths):
+            # Read + decode + preprocess run on the tf.data thread pool and
+            # prefetch keeps the next batches ready while the model runs.
+            def load_indexed(index, image_path):
+                return index, load_image(image_path)
+            
+            parallel_calls = pipeline['num_parallel_calls'] or tf.data.AUTOTUNE
+            prefetch = pipeline['prefetch_batches'] or tf.data.AUTOTUNE
+            dataset = (tf.data.Dataset.from_tensor_slices(image_paths)
+                       .enumerate()
+                       .map(load_indexed, num_parallel_calls=parallel_calls)
+                       .ignore_errors()
+                       .batch(batch_size)
+                       .prefetch(prefetch))
             
-            # Collect results as a tuple
-            results.append(Row(
+            # The pipeline keeps input order, so any index skipped by
+            # ignore_errors belongs to an image that failed to load.
+            expected = 0
+            batches = iter(dataset)
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    indices, images = next(batches)
+                except StopIteration:
+                    break
+                timers['input_wait'].add(time.perf_counter() - start_time)
+                preds = timed_predict(images)
+                for index, pred in zip(indices.numpy(), preds):
+                    while expected < index:
+                        yield error_row(image_paths[expected])
+                        expected += 1
+                    yield make_row(image_paths[index], pred)
+                    expected += 1
+            for image_path in image_paths[expected:]:
+                yield error_row(image_path)
+        
+        if pipeline['input_pipeline'] == 'tfdata':
+            # tf.data needs the partition's paths up front; they are only strings
+            image_paths = list(image_paths)
+            if image_paths:
+                yield from tfdata_predictions(image_paths)
+            return
+        
+        batch = []
+        for image_path in image_paths:
+            batch.append(image_path)
+            if len(batch) >= batch_size:
+                yield from predict_batch(batch)
+                batch = []
+        
+        # Flush the last, possibly partial, batch
+        if batch:
+            yield from predict_batch(batch)
+    
+    def inference_partition(rows_iter):
+        """RDD engine: Row objects in, one Row per image out."""
+        image_paths = (row.image_path for row in rows_iter if row.image_path)
+        for image_path, raw_prediction, predicted_class in run_inference(image_paths):
+            yield Row(
                 image_path=image_path,
-                raw_prediction=float(pred),
+                raw_prediction=raw_prediction,
                 predicted_class=predicted_class
-            ))
+            )
+    
+    def inference_batches(batches_iter):
+        """
+        Arrow engine: pandas DataFrames in, pandas DataFrames of results out,
+        one result frame per incoming Arrow batch. Each batch goes through the
+        model in forward passes of --batch_size images.
+        """
+        import pandas as pd
         
-        return results
+        for pdf in batches_iter:
+            image_paths = [image_path for image_path in pdf['image_path'].dropna() if image_path]
+            if not image_paths:
+                continue
+            yield (pd.DataFrame(list(run_inference(iter(image_paths))), columns=RESULT_COLUMNS)
+                   .astype({'raw_prediction': 'float64', 'predicted_class': 'int32'}))
+    
+    if args.engine == 'arrow':
+        if args.arrow_max_records > 0:
+            spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", args.arrow_max_records)
+        # Columnar path: one pass over the data, Arrow serialization, no schema inference
+        return df.select('image_path').mapInPandas(inference_batches, schema=RESULT_SCHEMA)
     
     # Convert to an RDD so we can use mapPartitions
     rdd = df.rdd.mapPartitions(inference_partition)
     
     # Convert the resulting RDD of Rows back to a Spark DataFrame
-    result_df = spark.createDataFrame(rdd)
+    return spark.createDataFrame(rdd, schema=RESULT_SCHEMA)
+
+def write_results(result_df, args, mode="overwrite"):
+    if args.write_mode == 'single':
+        # One task does all the writing (and, through coalesce, the inference too)
+        result_df = result_df.coalesce(1)
+    writer = result_df.write.mode(mode)
+    if args.output_format == 'parquet':
+        writer.parquet(args.output_csv)
+    else:
+        writer.option("header", "true").csv(args.output_csv)
+
+def merge_csv_parts(spark, src_dir, dest_file):
+    """
+    Concatenates the part-*.csv files of src_dir into dest_file on the
+    driver, keeping only the first header. The bytes are copied by Hadoop
+    inside the JVM; this is a sequential read of already-written output,
+    far cheaper than funnelling the whole job through one task.
+    """
+    jvm = spark.sparkContext._jvm
+    conf = spark.sparkContext._jsc.hadoopConfiguration()
+    src_path = jvm.org.apache.hadoop.fs.Path(src_dir)
+    fs = src_path.getFileSystem(conf)
+    parts = sorted(
+        (status.getPath() for status in fs.listStatus(src_path)
+         if status.getPath().getName().startswith('part-') and status.getPath().getName().endswith('.csv')),
+        key=lambda path: path.getName()
+    )
+    out = fs.create(jvm.org.apache.hadoop.fs.Path(dest_file), True)
+    try:
+        for i, part in enumerate(parts):
+            stream = fs.open(part)
+            try:
+                if i > 0:
+                    # Skip this part's header line
+                    while stream.read() not in (-1, 10):
+                        pass
+                jvm.org.apache.hadoop.io.IOUtils.copyBytes(stream, out, conf, False)
+            finally:
+                stream.close()
+    finally:
+        out.close()
+
+def hadoop_path_exists(spark, path):
+    jvm = spark.sparkContext._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    return hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()).exists(hadoop_path)
+
+def default_model_version(spark, model_path):
+    """'<model_path>@<modification time>'; for a SavedModel directory the saved_model.pb inside is used."""
+    jvm = spark.sparkContext._jvm
+    path = jvm.org.apache.hadoop.fs.Path(model_path)
+    fs = path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    pb_path = jvm.org.apache.hadoop.fs.Path(model_path.rstrip('/') + '/saved_model.pb')
+    if fs.isDirectory(path) and fs.exists(pb_path):
+        path = pb_path
+    return '%s@%d' % (model_path, fs.getFileStatus(path).getModificationTime())
+
+def has_data_files(spark, path):
+    """False when path holds only Spark's _temporary/_SUCCESS-style entries, e.g. after a killed first write."""
+    jvm = spark.sparkContext._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    fs = hadoop_path.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration())
+    if not fs.isDirectory(hadoop_path):
+        return True
+    # Spark's readers skip names starting with '_' or '.'
+    return any(not status.getPath().getName().startswith(('_', '.'))
+               for status in fs.listStatus(hadoop_path))
+
+def read_previous_results(spark, args):
+    if not hadoop_path_exists(spark, args.output_csv) or not has_data_files(spark, args.output_csv):
+        return None
+    if args.output_format == 'parquet':
+        return spark.read.parquet(args.output_csv)
+    return spark.read.option("header", "true").csv(args.output_csv)
+
+def run_incremental(spark, df, args):
+    """
+    Classifies only the images of df that have no result yet for this model
+    version (and, with --change_column, for this version of the image) and
+    appends them to --output_csv. Each chunk of --chunk_rows images is its
+    own committed append, so rerunning an interrupted job skips every chunk
+    that already finished. Images with only error rows (predicted_class -1)
+    are classified again, and the new row is appended next to the old one.
+    """
+    version = args.model_version or default_model_version(spark, args.model_path)
+    extra_columns = [args.change_column] if args.change_column else []
+    keys = ['image_path', 'model_version'] + extra_columns
+    # Columns classify() itself reads besides image_path
+    classify_columns = [args.size_column] if args.partitioning == 'size' and args.size_column else []
+    logger.info("Incremental run for model version %s", version)
+    
+    inputs = (df.where(col('image_path').isNotNull() & (col('image_path') != ''))
+                .select('image_path', *extra_columns, *[c for c in classify_columns if c not in extra_columns])
+                .withColumn('model_version', F.lit(version)))
+    previous = read_previous_results(spark, args)
+    if previous is not None:
+        missing = [c for c in keys if c not in previous.columns]
+        if missing:
+            raise ValueError("%s has no %s column(s); it was not written by an incremental run with these options"
+                             % (args.output_csv, ', '.join(missing)))
+        # Error rows (e.g. a transient read failure) don't count as done, so those images are retried
+        done = previous.where(col('predicted_class').cast('int') != -1)
+        inputs = inputs.join(done.select(*keys).distinct(), on=keys, how='left_anti')
+    
+    pending = inputs.dropDuplicates(['image_path']).cache()
+    pending_count = pending.count()
+    if pending_count == 0:
+        logger.info("Nothing to classify: every image already has a result for %s", version)
+        return
+    
+    # Chunks are assigned by hashing the path, so each rerun rebuilds them from what is still pending
+    num_chunks = max(1, int(math.ceil(pending_count / float(max(1, args.chunk_rows)))))
+    pending = pending.withColumn('_chunk', F.pmod(F.xxhash64('image_path'), F.lit(num_chunks)))
+    logger.info("%d images to classify in %d chunk(s)", pending_count, num_chunks)
+    
+    for chunk in range(num_chunks):
+        chunk_df = pending.where(col('_chunk') == chunk)
+        result_df = classify(spark, chunk_df.select('image_path', *classify_columns), args)
+        if extra_columns:
+            result_df = result_df.join(chunk_df.select('image_path', *extra_columns), on='image_path')
+        result_df = result_df.select(*RESULT_COLUMNS, *extra_columns).withColumn('model_version', F.lit(version))
+        write_results(result_df, args, mode="append")
+        logger.info("Appended chunk %d/%d", chunk + 1, num_chunks)
+    pending.unpersist()
+
+def main():
+    args = parse_args()
+    
+    # 1. Start Spark
+    spark = SparkSession.builder.appName("DistributedImageClassification").getOrCreate()
+    
+    # 2. Read the CSV from HDFS (must have at least one column: 'image_path')
+    df = spark.read.option("header", "true").csv(args.data_csv)
+    
+    if args.incremental:
+        # 3-5. Classify only what is new or changed since the last run and append it
+        run_incremental(spark, df, args)
+    else:
+        # 3-4. Build the inference plan
+        result_df = classify(spark, df, args)
+        
+        # 5. Write results to HDFS, one part file per partition unless asked otherwise
+        write_results(result_df, args)
+    
+    # Accumulators are only complete once the write has finished
+    log_stage_timings(stage_timers(spark))
     
-    # 5. Write results to HDFS as CSV
-    (result_df
-        .coalesce(1)
-        .write
-        .mode("overwrite")
-        .option("header", "true")
-        .csv(args.output_csv))
+    # 6. Optionally stitch the CSV parts into one file for single-file consumers
+    if args.merge_csv:
+        merge_csv_parts(spark, args.output_csv, args.merge_csv)
     
     spark.stop()
 
@@ -103,6 +530,8 @@ if __name__ == "__main__":
     main()
 
 
+# --py-files ships this repo's modules; --engine arrow additionally needs
+# pandas and pyarrow installed on the driver and every executor node.
 # spark-submit \
 #   --master yarn \
 #   --deploy-mode cluster \
@@ -110,9 +539,21 @@ if __name__ == "__main__":
 #   --executor-memory 4G \
 #   --executor-cores 2 \
 #   --num-executors 3 \
+#   --py-files model_cache.py,inference_backends.py \
 #   distributed_classify.py \
 #   --model_path hdfs://management:9000/path/to/save/best_model \
 #   --data_csv hdfs://management:9000/path/to/inference_data.csv \
 #   --output_csv hdfs://management:9000/path/to/output_predictions \
 #   --image_size 224,224 \
-#   --num_partitions 3
+#   --partitioning auto \
+#   --images_per_task 256 \
+#   --batch_size 32 \
+#   --backend function \
+#   --input_pipeline tfdata \
+#   --num_parallel_calls 4 \
+#   --engine arrow \
+#   --arrow_max_records 1024 \
+#   --write_mode parallel \
+#   --merge_csv hdfs://management:9000/path/to/output_predictions.csv \
+#   --incremental \
+#   --chunk_rows 10000
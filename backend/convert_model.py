@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Converts the trained Keras/SavedModel classifier to a .tflite file for the
+'tflite' inference backend.
+
+    none     - FP32 TFLite, no quantisation
+    dynamic  - dynamic-range quantisation: int8 weights, float activations
+    int8     - full integer quantisation of weights and activations,
+               calibrated on --calibration_images images from --calibration_csv
+
+    python convert_model.py --model_path best_model --output best_model_int8.tflite \\
+        --quantization int8 --calibration_csv hdfs://management:9000/path/to/inference_data.csv
+
+Check the result against the original with benchmark_backends.py before using it.
+"""
+import argparse
+import csv
+import logging
+
+import tensorflow as tf
+
+from inference_backends import preprocess_image
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def calibration_paths(csv_path, limit):
+    """First `limit` non-empty entries of the CSV's 'image_path' column."""
+    paths = []
+    with tf.io.gfile.GFile(csv_path, 'r') as f:
+        for row in csv.DictReader(f):
+            if row.get('image_path'):
+                paths.append(row['image_path'])
+                if len(paths) >= limit:
+                    break
+    return paths
+
+
+def make_converter(model_path):
+    if tf.io.gfile.isdir(model_path):
+        return tf.lite.TFLiteConverter.from_saved_model(model_path)
+    return tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(model_path))
+
+
+def convert(model_path, quantization='dynamic', image_size=(224, 224), calibration=None):
+    converter = make_converter(model_path)
+    if quantization in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if not calibration:
+            raise ValueError("int8 quantisation needs calibration images")
+
+        def representative_dataset():
+            for image_path in calibration:
+                yield [tf.expand_dims(preprocess_image(image_path, image_size), 0)]
+
+        converter.representative_dataset = representative_dataset
+        # Every op in int8; input and output stay float so callers need no changes
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', required=True,
+                        help="Keras model file or SavedModel directory to convert.")
+    parser.add_argument('--output', required=True,
+                        help="Path of the .tflite file to write (local or hdfs://...).")
+    parser.add_argument('--quantization', choices=['none', 'dynamic', 'int8'], default='dynamic')
+    parser.add_argument('--image_size', default='224,224',
+                        help="Target (height,width) for image resizing (match your model).")
+    parser.add_argument('--calibration_csv', default=None,
+                        help="CSV with an 'image_path' column, used to calibrate int8 quantisation.")
+    parser.add_argument('--calibration_images', type=int, default=200,
+                        help="Number of images from --calibration_csv used for calibration.")
+    args = parser.parse_args()
+    if args.quantization == 'int8' and not args.calibration_csv:
+        parser.error("--quantization int8 needs --calibration_csv")
+
+    height, width = map(int, args.image_size.split(','))
+    calibration = None
+    if args.calibration_csv:
+        calibration = calibration_paths(args.calibration_csv, args.calibration_images)
+        logger.info("Calibrating on %d images from %s", len(calibration), args.calibration_csv)
+
+    tflite_model = convert(args.model_path, args.quantization, (height, width), calibration)
+    with tf.io.gfile.GFile(args.output, 'wb') as f:
+        f.write(tflite_model)
+    logger.info("Wrote %s model to %s (%.1f MB)", args.quantization, args.output,
+                len(tflite_model) / float(1 << 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Interchangeable CPU inference backends for the image classifier.
+
+Every backend takes a float32 batch of preprocessed images, shaped
+[n, height, width, 3], and returns the model's raw score per image as a
+numpy array of shape [n]:
+
+    keras    - the Keras/SavedModel model called directly, full FP32
+    function - the same model traced once by tf.function with a fixed input
+               signature, so batches skip Keras' Python call overhead
+    tflite   - a .tflite file produced by convert_model.py (FP32,
+               dynamic-range or int8 quantised), run by the TFLite interpreter
+
+Backends are loaded through model_cache, so each executor/worker process
+builds one only once. Ship this file with the job alongside model_cache.py.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('keras', 'function', 'tflite')
+
+
+def preprocess_image(image_path, image_size):
+    """Same decode/resize/preprocessing as classify_images and inference_worker."""
+    import tensorflow as tf
+
+    image = tf.io.read_file(image_path)
+    image = tf.image.decode_jpeg(image, channels=3)
+    image = tf.image.resize(image, image_size)
+    return tf.keras.applications.resnet50.preprocess_input(image)
+
+
+class KerasBackend:
+    def __init__(self, model_path, image_size):
+        import tensorflow as tf
+
+        self.model = tf.keras.models.load_model(model_path)
+
+    def __call__(self, images):
+        return np.asarray(self.model(images, training=False))[:, 0]
+
+
+class FunctionBackend:
+    def __init__(self, model_path, image_size):
+        import tensorflow as tf
+
+        model = tf.keras.models.load_model(model_path)
+        height, width = image_size
+        # A None batch dimension lets the last, partial batch reuse the same trace
+        signature = [tf.TensorSpec([None, height, width, 3], tf.float32)]
+        self._forward = tf.function(lambda images: model(images, training=False),
+                                    input_signature=signature)
+        self.model = model
+
+    def __call__(self, images):
+        return self._forward(images).numpy()[:, 0]
+
+
+class TFLiteBackend:
+    def __init__(self, model_path, image_size, num_threads=None):
+        import tensorflow as tf
+        try:
+            # tf.lite.Interpreter is deprecated in favour of the LiteRT package
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            Interpreter = tf.lite.Interpreter
+
+        with tf.io.gfile.GFile(model_path, 'rb') as f:
+            self.interpreter = Interpreter(model_content=f.read(), num_threads=num_threads)
+        self.image_size = tuple(image_size)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = None
+
+    def _resize(self, batch):
+        # The interpreter has fixed tensor shapes; reallocate only when the batch size changes
+        shape = [batch, self.image_size[0], self.image_size[1], 3]
+        self.interpreter.resize_tensor_input(self._input['index'], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = batch
+
+    def __call__(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        if images.shape[0] != self._batch:
+            self._resize(images.shape[0])
+
+        dtype = self._input['dtype']
+        if dtype != np.float32:
+            # Fully int8 models take quantised input
+            scale, zero_point = self._input['quantization']
+            info = np.iinfo(dtype)
+            images = np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(dtype)
+        self.interpreter.set_tensor(self._input['index'], images)
+        self.interpreter.invoke()
+        preds = self.interpreter.get_tensor(self._output['index'])
+
+        if self._output['dtype'] != np.float32:
+            scale, zero_point = self._output['quantization']
+            preds = (preds.astype(np.float32) - zero_point) * scale
+        return preds[:, 0].astype(np.float32)
+
+
+def load_backend(model_path, backend='keras', image_size=(224, 224), num_threads=None):
+    if backend == 'keras':
+        return KerasBackend(model_path, image_size)
+    if backend == 'function':
+        return FunctionBackend(model_path, image_size)
+    if backend == 'tflite':
+        return TFLiteBackend(model_path, image_size, num_threads)
+    raise ValueError("Unknown inference backend: %s" % backend)
+
+
+def get_backend(model_path, backend='keras', image_size=(224, 224), num_threads=None, max_models=2):
+    """Returns the backend for model_path from this process' model cache, loading it on a miss."""
+    import model_cache
+
+    def loader(path):
+        logger.info("Loading '%s' inference backend for %s", backend, path)
+        return load_backend(path, backend, image_size, num_threads)
+
+    return model_cache.get_model(model_path, loader=loader, max_models=max_models,
+                                 variant=(backend, tuple(image_size), num_threads))
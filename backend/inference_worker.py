@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Long-running inference worker for the online /predict path.
+
+Loads the model once, consumes request_queue and groups the requests that
+arrive within --batch_window_ms (up to --max_batch_size) into a single
+forward pass. Each reply carries the request's correlation_id and goes to
+its reply_to queue, or to response_queue when the request has none.
+
+Request body:  {"filename": ..., "hdfs_path": ...}, or for an image the app
+               has already downscaled (see ingest.py)
+               {"filename": ..., "image": <base64>, "encoding": "jpeg"|"uint8",
+                "shape": [height, width, 3]}
+Reply body:    the predicted class ("0" or "1"), same as before; the raw
+               score or an error message travel in the reply headers, along
+               with inference_seconds, the duration of the forward pass. The
+               numbers are decimal strings, since pika cannot encode float
+               headers.
+
+Batch request: {"images": [<either of the above>, ...]}
+Batch replies: one per forward pass that touched the batch, each a JSON list
+               of {"index", "hdfs_path", "Result", "raw_prediction", "msg"}
+               (hdfs_path is null for inline images).
+"""
+import argparse
+import base64
+import json
+import logging
+import time
+
+import pika
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# -----------------------------------------------------------------------------
+# RabbitMQ Configuration (must match app.py)
+# -----------------------------------------------------------------------------
+RABBITMQ_HOST = 'worker1'
+credentials = pika.PlainCredentials('myuser', 'mypassword')
+EXCHANGE_NAME = 'direct_logs'
+REQUEST_QUEUE = 'request_queue'
+REQUEST_ROUTING_KEY = 'request_key'
+RESPONSE_QUEUE = 'response_queue'
+RESPONSE_ROUTING_KEY = 'response_key'
+
+# How long process_data_events may block while idle, so stop() is noticed
+IDLE_POLL_SECONDS = 1.0
+
+# -----------------------------------------------------------------------------
+# Predictor
+# -----------------------------------------------------------------------------
+class ModelPredictor:
+    """
+    Wraps the model through one of the inference_backends. predict() takes a
+    list of images (HDFS paths or InlineImages) and returns one raw score per
+    image, or the exception raised while loading it, using a single forward
+    pass for the whole batch.
+    """
+    def __init__(self, model_path, image_size=(224, 224), hdfs_prefix='', backend='keras',
+                 num_threads=None):
+        import tensorflow as tf
+        import inference_backends
+
+        self.tf = tf
+        self.image_size = image_size
+        self.hdfs_prefix = hdfs_prefix
+        self.model = inference_backends.get_backend(model_path, backend, image_size, num_threads)
+
+    def load_image(self, image):
+        tf = self.tf
+        if isinstance(image, InlineImage):
+            if image.encoding == 'uint8':
+                pixels = tf.reshape(tf.io.decode_raw(image.data, tf.uint8), image.shape)
+            else:
+                pixels = tf.image.decode_jpeg(image.data, channels=3)
+        else:
+            pixels = tf.image.decode_jpeg(tf.io.read_file(self.hdfs_prefix + image), channels=3)
+        if tuple(pixels.shape[:2]) != tuple(self.image_size):
+            pixels = tf.image.resize(pixels, self.image_size)
+        return tf.keras.applications.resnet50.preprocess_input(tf.cast(pixels, tf.float32))
+
+    def predict(self, images):
+        results = [None] * len(images)
+        batch, positions = [], []
+        for i, image in enumerate(images):
+            try:
+                batch.append(self.load_image(image))
+                positions.append(i)
+            except Exception as e:
+                results[i] = e
+        if batch:
+            preds = self.model(self.tf.stack(batch))
+            for i, pred in zip(positions, preds):
+                results[i] = float(pred)
+        return results
+
+# -----------------------------------------------------------------------------
+# Worker
+# -----------------------------------------------------------------------------
+class InferenceWorker:
+    def __init__(self, connection, predictor, batch_window=0.01, max_batch_size=32):
+        self.connection = connection
+        self.channel = connection.channel()
+        self.predictor = predictor
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._pending_images = 0
+        self._deadline = None
+        self._running = False
+        self.batches = 0
+        self.requests = 0
+
+    def declare_topology(self):
+        self.channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type='direct')
+        self.channel.queue_declare(queue=REQUEST_QUEUE, durable=True)
+        self.channel.queue_bind(exchange=EXCHANGE_NAME, queue=REQUEST_QUEUE, routing_key=REQUEST_ROUTING_KEY)
+        self.channel.queue_declare(queue=RESPONSE_QUEUE, durable=True)
+        self.channel.queue_bind(exchange=EXCHANGE_NAME, queue=RESPONSE_QUEUE, routing_key=RESPONSE_ROUTING_KEY)
+
+    def _on_message(self, ch, method, properties, body):
+        if not self._pending:
+            self._deadline = time.monotonic() + self.batch_window
+        request = InferenceRequest(method, properties, body)
+        self._pending.append(request)
+        self._pending_images += len(request.images)
+
+    def run(self):
+        self.declare_topology()
+        # Let the broker hand us enough messages to fill a couple of batches
+        self.channel.basic_qos(prefetch_count=self.max_batch_size * 2)
+        self.channel.basic_consume(queue=REQUEST_QUEUE, on_message_callback=self._on_message)
+        self._running = True
+        logger.info("Inference worker started (batch window %.1f ms, max batch %d)",
+                    self.batch_window * 1000, self.max_batch_size)
+        while self._running:
+            if self._pending:
+                time_limit = max(0.0, self._deadline - time.monotonic())
+            else:
+                time_limit = IDLE_POLL_SECONDS
+            self.connection.process_data_events(time_limit=time_limit)
+            if self._pending and (self._pending_images >= self.max_batch_size
+                                  or time.monotonic() >= self._deadline):
+                requests, self._pending, self._pending_images = self._pending, [], 0
+                self.handle_batch(requests)
+        # Anything still buffered goes back to the queue for another worker
+        for request in self._pending:
+            self.channel.basic_nack(delivery_tag=request.method.delivery_tag, requeue=True)
+        self._pending = []
+        self._pending_images = 0
+
+    def stop(self):
+        self._running = False
+
+    def handle_batch(self, requests):
+        """
+        Runs the images of all requests through the model in chunks of
+        max_batch_size. Single requests get their reply as soon as their image
+        is done; multi-image requests get one partial reply per chunk.
+        """
+        items = []
+        for request in requests:
+            if request.error is not None or not request.images:
+                self.reply(request, [])
+                self.channel.basic_ack(delivery_tag=request.method.delivery_tag)
+                continue
+            items.extend((request, index, image) for index, image in enumerate(request.images))
+
+        for start in range(0, len(items), self.max_batch_size):
+            chunk = items[start:start + self.max_batch_size]
+            start_time = time.time()
+            preds = self.predict([image for _, _, image in chunk])
+            inference_seconds = time.time() - start_time
+            finished = {}
+            for (request, index, image), pred in zip(chunk, preds):
+                finished.setdefault(request, []).append((index, image, pred))
+            for request, results in finished.items():
+                self.reply(request, results, inference_seconds)
+                request.remaining -= len(results)
+                if request.remaining == 0:
+                    self.channel.basic_ack(delivery_tag=request.method.delivery_tag)
+            self.batches += 1
+        self.requests += len(requests)
+
+    def predict(self, images):
+        start_time = time.time()
+        try:
+            preds = self.predictor.predict(images)
+        except Exception as e:
+            logger.error("Batch inference failed: %s", e)
+            preds = [e] * len(images)
+        logger.debug("Predicted batch of %d in %.3f seconds", len(images), time.time() - start_time)
+        return preds
+
+    def reply(self, request, results, inference_seconds=None):
+        if request.error is not None:
+            body = ''
+            headers = {'error': str(request.error)}
+        elif request.is_batch:
+            body = json.dumps([result_entry(index, image, pred) for index, image, pred in results])
+            headers = {'batch_size': len(request.images)}
+        elif isinstance(results[0][2], Exception):
+            body = ''
+            headers = {'error': str(results[0][2])}
+        else:
+            body = predicted_class(results[0][2])
+            headers = {'raw_prediction': repr(float(results[0][2]))}
+        if inference_seconds is not None:
+            # pika cannot encode floats in header tables, so numbers travel as strings
+            headers['inference_seconds'] = '%.6f' % inference_seconds
+
+        properties = pika.BasicProperties(correlation_id=request.correlation_id, headers=headers)
+        if request.reply_to:
+            self.channel.basic_publish(exchange='', routing_key=request.reply_to, body=body, properties=properties)
+        else:
+            self.channel.basic_publish(exchange=EXCHANGE_NAME, routing_key=RESPONSE_ROUTING_KEY,
+                                       body=body, properties=properties)
+
+
+class InlineImage:
+    """An image carried in the request body, already downscaled by the app."""
+    def __init__(self, data, encoding='jpeg', shape=None, name=None):
+        self.data = data
+        self.encoding = encoding
+        self.shape = shape
+        self.name = name
+
+    def __str__(self):
+        return self.name or '<inline image>'
+
+
+def parse_image(entry):
+    """An HDFS path, or an InlineImage when the entry carries the image itself."""
+    if 'image' in entry:
+        return InlineImage(base64.b64decode(entry['image']), entry.get('encoding', 'jpeg'),
+                           entry.get('shape'), entry.get('filename'))
+    return entry['hdfs_path']
+
+
+class InferenceRequest:
+    """
+    One message from request_queue: either a single image
+    {"filename": ..., "hdfs_path": ...} or a batch {"images": [{...}, ...]}.
+    """
+    def __init__(self, method, properties, body):
+        self.method = method
+        self.correlation_id = getattr(properties, 'correlation_id', None)
+        self.reply_to = getattr(properties, 'reply_to', None)
+        self.is_batch = False
+        self.images = []
+        self.error = None
+        try:
+            data = json.loads(body)
+            if 'images' in data:
+                self.is_batch = True
+                self.images = [parse_image(image) for image in data['images']]
+            else:
+                self.images = [parse_image(data)]
+        except (ValueError, KeyError, TypeError) as e:
+            self.error = e
+        self.remaining = len(self.images)
+
+
+def predicted_class(pred):
+    # If it's a binary classifier, threshold at 0.5 for class
+    return str(int(pred >= 0.5))
+
+
+def result_entry(index, image, pred):
+    hdfs_path = None if isinstance(image, InlineImage) else image
+    if isinstance(pred, Exception):
+        return {'index': index, 'hdfs_path': hdfs_path, 'Result': None, 'raw_prediction': None,
+                'msg': str(pred)}
+    return {'index': index, 'hdfs_path': hdfs_path, 'Result': predicted_class(pred),
+            'raw_prediction': pred, 'msg': None}
+
+# -----------------------------------------------------------------------------
+# Main
+# -----------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model_path', required=True,
+                        help="Path of the SavedModel to serve (local or hdfs://...), or of a .tflite file with --backend tflite.")
+    parser.add_argument('--backend', choices=['keras', 'function', 'tflite'], default='keras',
+                        help="Inference backend, see inference_backends.py.")
+    parser.add_argument('--tflite_threads', type=int, default=0,
+                        help="Threads used by the TFLite interpreter. 0 lets TFLite decide.")
+    parser.add_argument('--image_size', default='224,224',
+                        help="Target (height,width) for image resizing (match your model).")
+    parser.add_argument('--hdfs_prefix', default='hdfs://management:9000',
+                        help="Prefix added to the hdfs_path of each request before reading it.")
+    parser.add_argument('--batch_window_ms', type=float, default=10,
+                        help="How long to wait for more requests after the first one of a batch.")
+    parser.add_argument('--max_batch_size', type=int, default=32,
+                        help="Maximum number of requests per forward pass.")
+    args = parser.parse_args()
+
+    height, width = map(int, args.image_size.split(','))
+    predictor = ModelPredictor(args.model_path, (height, width), args.hdfs_prefix,
+                               args.backend, args.tflite_threads or None)
+    connection = pika.BlockingConnection(
+        pika.ConnectionParameters(host=RABBITMQ_HOST, credentials=credentials)
+    )
+    worker = InferenceWorker(connection, predictor,
+                             batch_window=args.batch_window_ms / 1000.0,
+                             max_batch_size=args.max_batch_size)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        logger.info("Inference worker stopping")
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Upload-side ingest: decode and downscale an uploaded image once, so the
+request message can carry the model-sized image itself instead of an HDFS
+path to the full upload.
+
+JPEGs are decoded with Pillow's draft mode, which lets libjpeg decode
+straight to 1/2, 1/4 or 1/8 scale, the smallest that is still at least the
+target size, before the final resize. Two payload encodings are supported:
+
+    jpeg   - the resized image re-encoded as a JPEG thumbnail (a few tens of KB)
+    uint8  - the raw [height, width, 3] uint8 pixels (150 KB at 224x224,
+             about 200 KB once base64 encoded)
+
+'jpeg' is a second lossy step on top of the resize, so an image can score
+slightly differently than it would through HDFS; benchmark_ingest.py
+reports how often the two routes agree.
+
+prepare_inline() returns None when the upload should take the HDFS path
+instead: it is larger than max_upload_bytes, cannot be decoded here, or the
+base64 payload, as sent, would exceed max_payload_bytes.
+"""
+import base64
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ('jpeg', 'uint8')
+
+
+def downscale(fileobj, image_size):
+    """Decodes fileobj into an RGB PIL image of exactly image_size (height, width)."""
+    from PIL import Image
+
+    height, width = image_size
+    image = Image.open(fileobj)
+    # Only has an effect on JPEGs: picks the cheapest DCT scale still >= the target
+    image.draft('RGB', (width, height))
+    # Stretched like tf.image.resize in the worker, not cropped
+    return image.convert('RGB').resize((width, height), Image.BILINEAR)
+
+
+def encode(image, encoding='jpeg', quality=90):
+    if encoding == 'jpeg':
+        out = io.BytesIO()
+        image.save(out, format='JPEG', quality=quality)
+        return out.getvalue()
+    if encoding == 'uint8':
+        return image.tobytes()
+    raise ValueError("Unknown ingest encoding: %s" % encoding)
+
+
+def prepare_inline(fileobj, size, image_size=(224, 224), encoding='jpeg', quality=90,
+                   max_upload_bytes=2 * 1024 * 1024, max_payload_bytes=256 * 1024):
+    """
+    Returns the message fields for an inline image
+    ({"image", "encoding", "shape"}), or None to fall back to HDFS.
+    fileobj is left rewound either way.
+    """
+    if size > max_upload_bytes:
+        return None
+    try:
+        fileobj.seek(0)
+        data = encode(downscale(fileobj, image_size), encoding, quality)
+    except Exception as e:
+        logger.info("Could not downscale upload, sending it through HDFS: %s", e)
+        return None
+    finally:
+        fileobj.seek(0)
+    payload = base64.b64encode(data).decode('ascii')
+    if len(payload) > max_payload_bytes:
+        return None
+    return {
+        'image': payload,
+        'encoding': encoding,
+        'shape': [image_size[0], image_size[1], 3],
+    }
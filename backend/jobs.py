@@ -0,0 +1,133 @@
+"""
+Bounded in-memory table of asynchronous prediction jobs.
+
+Jobs are kept in insertion order; anything older than `ttl` seconds is
+evicted, and when the table is full the oldest job is dropped to make room.
+A job still pending after `result_timeout` seconds is marked as timed out,
+either when it is next read or by the sweeper thread (start()), whichever
+comes first. `on_evict(job_id)` / `on_timeout(job)` let the caller release
+whatever it holds for a job (e.g. the RPC future waiting for its reply) and,
+on timeout, tell whoever is waiting for the result.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DONE = 'done'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+
+
+class JobTable:
+    def __init__(self, max_jobs=10000, ttl=300, result_timeout=10, on_evict=None, on_timeout=None,
+                 sweep_interval=1.0):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.result_timeout = result_timeout
+        self.on_evict = on_evict
+        self.on_timeout = on_timeout
+        self.sweep_interval = sweep_interval
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the thread that times out overdue jobs nobody is polling."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='job-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sweep(self):
+        """Evicts expired jobs and times out overdue ones."""
+        now = time.time()
+        with self._lock:
+            evicted = self._purge(now)
+            timed_out = self._expire(now)
+        self._notify(self.on_evict, evicted)
+        self._notify(self.on_timeout, timed_out)
+
+    def create(self, job_id, owner, **extra):
+        now = time.time()
+        job = dict(extra, id=job_id, owner=owner, status=PENDING, result=None, error=None,
+                   created=now, updated=now)
+        with self._lock:
+            evicted = self._purge(now)
+            while len(self._jobs) >= self.max_jobs:
+                evicted.append(self._jobs.popitem(last=False)[0])
+            self._jobs[job_id] = job
+        self._notify(self.on_evict, evicted)
+        return dict(job)
+
+    def get(self, job_id):
+        now = time.time()
+        with self._lock:
+            evicted = self._purge(now)
+            timed_out = self._expire(now)
+            job = self._jobs.get(job_id)
+            job = dict(job) if job else None
+        self._notify(self.on_evict, evicted)
+        self._notify(self.on_timeout, timed_out)
+        return job
+
+    def complete(self, job_id, result=None, error=None):
+        """Records the outcome; returns the updated job or None if it is gone."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != PENDING:
+                return None
+            job.update(status=ERROR if error else DONE, result=result, error=error,
+                       updated=time.time())
+            return dict(job)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _purge(self, now):
+        evicted = []
+        while self._jobs:
+            job_id, job = next(iter(self._jobs.items()))
+            if now - job['created'] <= self.ttl:
+                break
+            del self._jobs[job_id]
+            evicted.append(job_id)
+        return evicted
+
+    def _expire(self, now):
+        """Marks overdue pending jobs as timed out; returns copies of them."""
+        timed_out = []
+        for job in self._jobs.values():
+            # Insertion order is creation order, so the rest are younger still
+            if now - job['created'] <= self.result_timeout:
+                break
+            if job['status'] == PENDING:
+                job.update(status=TIMEOUT, error="Prediction result not received within timeout",
+                           updated=now)
+                timed_out.append(dict(job))
+        return timed_out
+
+    def _run(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Job sweep failed")
+
+    @staticmethod
+    def _notify(callback, items):
+        if callback:
+            for item in items:
+                callback(item)
@@ -0,0 +1,239 @@
+"""
+In-process stand-ins for the services the backend talks to, so the workers
+can be exercised and benchmarked without the worker1/management hosts.
+
+FakeBroker implements the small part of the pika BlockingConnection /
+BlockingChannel API the backend uses: direct exchanges, the default
+exchange, basic_publish, basic_get, basic_consume (including exclusive
+consumers) + process_data_events / start_consuming. With
+STORAGE_BACKEND=local (storage.LocalStorage) and StubPredictor below,
+app.py and inference_worker run entirely in-process.
+"""
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+import pika.exceptions
+
+
+class FakeMethod:
+    def __init__(self, delivery_tag, routing_key):
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+
+
+class FakeDeclareOk:
+    """Mimics the frame returned by queue_declare: result.method.queue / .message_count."""
+    def __init__(self, queue, message_count=0):
+        self.method = self
+        self.queue = queue
+        self.message_count = message_count
+        self.consumer_count = 0
+
+
+class FakeBroker:
+    def __init__(self):
+        self._queues = defaultdict(deque)
+        self._bindings = defaultdict(set)
+        self._cond = threading.Condition()
+        self._delivery_tag = 0
+        self._queue_counter = 0
+        self._consumers = defaultdict(set)
+        self._exclusive = {}
+        # Delivery tags, in order, so tests can check what was acked or requeued
+        self.acked = []
+        self.nacked = []
+
+    def connection(self, *args, **kwargs):
+        """Drop-in for pika.BlockingConnection(params)."""
+        return FakeConnection(self)
+
+    def bind(self, exchange, queue, routing_key):
+        with self._cond:
+            self._bindings[(exchange, routing_key)].add(queue)
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self._cond:
+            if exchange == '':
+                targets = {routing_key}
+            else:
+                targets = self._bindings.get((exchange, routing_key), set())
+            for queue in targets:
+                self._queues[queue].append((routing_key, properties, body))
+            self._cond.notify_all()
+
+    def pop(self, queue):
+        """Returns (method, properties, body) or (None, None, None)."""
+        with self._cond:
+            return self._pop_locked(queue)
+
+    def _pop_locked(self, queue):
+        if not self._queues[queue]:
+            return None, None, None
+        routing_key, properties, body = self._queues[queue].popleft()
+        self._delivery_tag += 1
+        return FakeMethod(self._delivery_tag, routing_key), properties, body
+
+    def declare(self, queue):
+        with self._cond:
+            if not queue:
+                # Server-named queue, like RabbitMQ's amq.gen-*
+                self._queue_counter += 1
+                queue = 'amq.gen-%d' % self._queue_counter
+            self._queues[queue]
+            return queue
+
+    def add_consumer(self, queue, channel, exclusive=False):
+        """Refuses the consumer like RabbitMQ's ACCESS_REFUSED when exclusivity clashes."""
+        with self._cond:
+            others = {c for c in self._consumers[queue] if c is not channel and c.is_open}
+            owner = self._exclusive.get(queue)
+            if (owner is not None and owner is not channel and owner.is_open) or (exclusive and others):
+                raise pika.exceptions.ChannelClosedByBroker(
+                    403, "ACCESS_REFUSED - queue '%s' in exclusive use" % queue)
+            self._consumers[queue].add(channel)
+            if exclusive:
+                self._exclusive[queue] = channel
+
+    def remove_consumers(self, channel):
+        with self._cond:
+            for consumers in self._consumers.values():
+                consumers.discard(channel)
+            for queue in [q for q, owner in self._exclusive.items() if owner is channel]:
+                del self._exclusive[queue]
+
+    def queue_depth(self, queue):
+        with self._cond:
+            return len(self._queues[queue])
+
+    def wait(self, queues, timeout):
+        """Blocks until one of queues has a message or timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not any(self._queues[q] for q in queues):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+
+class FakeConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self._channels = []
+
+    def channel(self):
+        channel = FakeChannel(self)
+        self._channels.append(channel)
+        return channel
+
+    def process_data_events(self, time_limit=0):
+        """Dispatches pending messages to basic_consume callbacks."""
+        consumers = [(ch, q, cb) for ch in self._channels for q, cb in ch._consumers.items()]
+        if not consumers:
+            time.sleep(time_limit or 0)
+            return
+        if not self.broker.wait([q for _, q, _ in consumers], time_limit):
+            return
+        for channel, queue, callback in consumers:
+            while True:
+                method, properties, body = self.broker.pop(queue)
+                if method is None:
+                    break
+                callback(channel, method, properties, body)
+
+    def close(self):
+        self.is_open = False
+        for channel in self._channels:
+            channel.close()
+        self.broker.wake()
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.is_open = True
+        self._consumers = {}
+        self._consuming = False
+
+    def exchange_declare(self, exchange, exchange_type='direct', **kwargs):
+        pass
+
+    def queue_declare(self, queue, **kwargs):
+        queue = self.broker.declare(queue)
+        return FakeDeclareOk(queue, self.broker.queue_depth(queue))
+
+    def queue_bind(self, exchange, queue, routing_key):
+        self.broker.bind(exchange, queue, routing_key)
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        pass
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, **kwargs):
+        if properties is not None:
+            # Fails like pika would on properties it cannot put on the wire (e.g. float headers)
+            properties.encode()
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def basic_get(self, queue, auto_ack=False):
+        return self.broker.pop(queue)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False, **kwargs):
+        try:
+            self.broker.add_consumer(queue, self, exclusive)
+        except pika.exceptions.ChannelClosedByBroker:
+            self.close()
+            raise
+        self._consumers[queue] = on_message_callback
+        return queue
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open:
+            self.connection.process_data_events(time_limit=1.0)
+
+    def stop_consuming(self):
+        self._consuming = False
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.broker.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.broker.nacked.append(delivery_tag)
+
+    def close(self):
+        self.is_open = False
+        self._consumers = {}
+        self.broker.remove_consumers(self)
+
+
+class StubPredictor:
+    """
+    Model stand-in with the same predict() contract as the real predictors.
+    Each call costs call_overhead seconds plus per_image seconds per image,
+    which is roughly how a Keras forward pass on CPU scales with batch size.
+    """
+    def __init__(self, call_overhead=0.02, per_image=0.002):
+        self.call_overhead = call_overhead
+        self.per_image = per_image
+        self.calls = 0
+
+    def predict(self, images):
+        self.calls += 1
+        time.sleep(self.call_overhead + self.per_image * len(images))
+        # Deterministic pseudo score so repeated paths (or inline images) give the same answer
+        return [(zlib.crc32(getattr(image, 'data', None) or image.encode('utf-8')) % 1000) / 1000.0
+                for image in images]
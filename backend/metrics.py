@@ -0,0 +1,90 @@
+"""
+Prometheus metrics for the prediction path, served by /metrics.
+
+    prediction_stage_seconds{stage}   histogram per stage of a prediction:
+        save        - Werkzeug parsing/spooling the multipart upload
+        ingest      - decoding and downscaling the upload for an inline request
+        hdfs_upload - storage.put of the image
+        publish     - handing the request to RabbitMQ
+        queue_wait  - reply round trip minus the worker's inference time
+        inference   - the worker's forward pass (from the reply headers)
+        total       - the whole /predict request
+    prediction_timeouts_total{endpoint} / prediction_errors_total{endpoint}
+        counted per image
+    prediction_dispatch_bytes_total{route} / prediction_dispatch_images_total{route}
+        image bytes handed on per image, by route: inline (in the request
+        message) or hdfs (uploaded, then read back by the worker)
+
+Component stats (publisher pool, prediction cache, queue depths) are read
+when /metrics is scraped, through register_stats().
+"""
+import logging
+import numbers
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = CollectorRegistry()
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = Histogram('prediction_stage_seconds', "Time spent in each stage of a prediction",
+                          ['stage'], buckets=STAGE_BUCKETS, registry=REGISTRY)
+TIMEOUTS = Counter('prediction_timeouts', "Images whose prediction did not arrive in time",
+                   ['endpoint'], registry=REGISTRY)
+ERRORS = Counter('prediction_errors', "Images whose prediction failed",
+                 ['endpoint'], registry=REGISTRY)
+DISPATCH_BYTES = Counter('prediction_dispatch_bytes', "Image bytes sent on towards the worker",
+                         ['route'], registry=REGISTRY)
+DISPATCH_IMAGES = Counter('prediction_dispatch_images', "Images sent on towards the worker",
+                          ['route'], registry=REGISTRY)
+
+
+def observe_reply(sent_time, reply_time, headers):
+    """Splits a request's round trip into worker inference and time spent queued."""
+    inference = (headers or {}).get('inference_seconds')
+    round_trip = reply_time - sent_time
+    if inference is None:
+        STAGE_SECONDS.labels('queue_wait').observe(max(0.0, round_trip))
+        return
+    STAGE_SECONDS.labels('inference').observe(float(inference))
+    STAGE_SECONDS.labels('queue_wait').observe(max(0.0, round_trip - float(inference)))
+
+
+class StatsCollector:
+    """
+    Exposes the numeric values of a stats() dict as <prefix>_<key> metrics,
+    counters for the keys in `counters` and gauges for the rest.
+    """
+    def __init__(self, prefix, stats, description, counters=()):
+        self.prefix = prefix
+        self.stats = stats
+        self.description = description
+        self.counters = set(counters)
+
+    def collect(self):
+        try:
+            stats = self.stats() or {}
+        except Exception as e:
+            # A scrape must not fail because one component is unavailable
+            logger.warning("Could not collect %s metrics: %s", self.prefix, e)
+            return
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, numbers.Number):
+                continue
+            name = '%s_%s' % (self.prefix, key)
+            if key in self.counters:
+                yield CounterMetricFamily(name, '%s: %s' % (self.description, key), value=value)
+            else:
+                yield GaugeMetricFamily(name, '%s: %s' % (self.description, key), value=value)
+
+
+def register_stats(prefix, stats, description, counters=()):
+    REGISTRY.register(StatsCollector(prefix, stats, description, counters))
+
+
+def render():
+    """Returns (body, content type) for the /metrics response."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
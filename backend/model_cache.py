@@ -0,0 +1,110 @@
+"""
+Process-level model cache for the Spark executor Python workers.
+
+Spark reuses its Python workers between tasks (spark.python.worker.reuse),
+so module state here survives from one partition to the next. Models are
+keyed by (model_path, modification time) so a re-saved model is picked up,
+and the cache is LRU bounded so old model versions do not pile up in memory.
+
+Ship this file with the job: spark-submit --py-files model_cache.py ...
+"""
+import gc
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    # Executors do not configure logging; send our lines to the YARN stderr log.
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # Where the root logger is configured too (driver, worker, benchmarks), print each line once
+    logger.propagate = False
+
+DEFAULT_MAX_MODELS = 2
+
+_models = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _load_keras_model(model_path):
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
+
+
+def model_mtime(model_path):
+    """
+    Returns the modification time of the model, or None if it can't be read.
+    For a SavedModel directory the saved_model.pb inside is checked, since it
+    is rewritten on every save.
+    """
+    import tensorflow as tf
+    try:
+        stat_path = model_path
+        if tf.io.gfile.isdir(model_path):
+            pb_path = model_path.rstrip('/') + '/saved_model.pb'
+            if tf.io.gfile.exists(pb_path):
+                stat_path = pb_path
+        return tf.io.gfile.stat(stat_path).mtime_nsec
+    except Exception as e:
+        logger.warning("Could not stat model at %s: %s", model_path, e)
+        return None
+
+
+def get_model(model_path, loader=None, max_models=DEFAULT_MAX_MODELS, mtime=None, variant=None):
+    """
+    Returns the model at model_path, loading it only if this worker process
+    has not already loaded the same version.
+    loader: callable taking model_path; defaults to tf.keras.models.load_model.
+    variant: hashable that tells apart different loaders of the same file
+             (e.g. the inference backend built from it).
+    """
+    loader = loader or _load_keras_model
+    if mtime is None:
+        mtime = model_mtime(model_path)
+    key = (model_path, mtime, variant)
+
+    with _lock:
+        if key in _models:
+            _models.move_to_end(key)
+            _stats['hits'] += 1
+            logger.info("Model cache hit for %s (hits=%d, misses=%d)",
+                        model_path, _stats['hits'], _stats['misses'])
+            return _models[key]
+
+        _stats['misses'] += 1
+        start_time = time.time()
+        model = loader(model_path)
+        logger.info("Model cache miss for %s, loaded in %.2f seconds (hits=%d, misses=%d)",
+                    model_path, time.time() - start_time, _stats['hits'], _stats['misses'])
+
+        # A new version of a path replaces the old ones straight away
+        for stale_key in [k for k in _models if k[0] == model_path and k[1] != mtime]:
+            _evict(stale_key)
+        _models[key] = model
+        while len(_models) > max(1, max_models):
+            _evict(next(iter(_models)))
+        return model
+
+
+def _evict(key):
+    del _models[key]
+    _stats['evictions'] += 1
+    logger.info("Evicted model %s (mtime=%s) from cache", key[0], key[1])
+    gc.collect()
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, size=len(_models))
+
+
+def clear():
+    with _lock:
+        _models.clear()
+        gc.collect()
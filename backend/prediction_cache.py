@@ -0,0 +1,147 @@
+"""
+Prediction cache keyed by the content hash of the uploaded image.
+
+Keys combine the model version with the SHA-256 of the image bytes, so
+resubmitting the same image is answered without touching HDFS or RabbitMQ,
+and deploying a new model version makes the old entries unreachable.
+
+    memory - in-process LRU, lost on restart
+    sqlite - on-disk LRU that survives restarts
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(fileobj):
+    """SHA-256 of a file-like object, leaving it rewound for the next reader."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(model_version, digest):
+    return '%s:%s' % (model_version, digest)
+
+
+class MemoryPredictionCache:
+    def __init__(self, max_entries=10000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_entries=self.max_entries)
+
+
+class SqlitePredictionCache:
+    def __init__(self, path, max_entries=100000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM predictions WHERE key = ? AND created >= ?', (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE predictions SET last_used = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self._stats['hits'] += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO predictions (key, value, created, last_used) VALUES (?, ?, ?, ?)',
+                (key, value, now, now)
+            )
+            # Expired rows first, then the least recently used beyond the limit
+            cursor = self._conn.execute('DELETE FROM predictions WHERE created < ?', (now - self.ttl,))
+            evicted = cursor.rowcount
+            cursor = self._conn.execute(
+                'DELETE FROM predictions WHERE key IN '
+                '(SELECT key FROM predictions ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            evicted += cursor.rowcount
+            self._conn.commit()
+            self._stats['evictions'] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM predictions')
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            return dict(self._stats, size=size, max_entries=self.max_entries)
+
+
+def prediction_cache_from_env():
+    backend = os.getenv('PREDICTION_CACHE_BACKEND', 'memory')
+    max_entries = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+    ttl = int(os.getenv('PREDICTION_CACHE_TTL_SECONDS', '86400'))
+    logger.info("Using '%s' prediction cache", backend)
+    if backend == 'memory':
+        return MemoryPredictionCache(max_entries, ttl)
+    if backend == 'sqlite':
+        return SqlitePredictionCache(os.getenv('PREDICTION_CACHE_PATH', 'prediction_cache.db'),
+                                     max_entries, ttl)
+    if backend == 'none':
+        return None
+    raise ValueError("Unknown PREDICTION_CACHE_BACKEND: %s" % backend)
@@ -0,0 +1,150 @@
+"""
+Request/reply over RabbitMQ using correlation ids.
+
+A single long-lived consumer thread owns an exclusive, server-named reply
+queue. Each request registers a Future under its correlation_id and sends
+reply_to=<reply queue>; when the reply arrives the consumer thread resolves
+the matching Future, so a waiting handler wakes up as soon as its own
+response is delivered and never sees anyone else's.
+
+Requests that expect several replies (batches) subscribe() instead and get a
+queue of (body, headers) pairs, or the exception that ended the stream.
+A resolved Future carries the reply headers in its `headers` attribute.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class RpcClient:
+    def __init__(self, connection_factory, poll_interval=1.0, reconnect_delay=2.0):
+        """
+        connection_factory: callable returning a new pika.BlockingConnection
+        (or anything with the same interface, e.g. local_fakes.FakeBroker).
+        """
+        self.connection_factory = connection_factory
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._futures = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._reply_queue = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='rpc-reply-consumer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def reply_queue(self, timeout=5):
+        """Name of the reply queue, or None if the consumer isn't connected."""
+        self.start()
+        if not self._ready.wait(timeout):
+            return None
+        return self._reply_queue
+
+    def register(self, correlation_id):
+        future = Future()
+        with self._lock:
+            self._futures[correlation_id] = future
+        return future
+
+    def subscribe(self, correlation_id):
+        replies = queue.Queue()
+        with self._lock:
+            self._streams[correlation_id] = replies
+        return replies
+
+    def discard(self, correlation_id):
+        with self._lock:
+            self._futures.pop(correlation_id, None)
+            self._streams.pop(correlation_id, None)
+
+    def wait(self, correlation_id, future, timeout):
+        """
+        Returns the reply body for correlation_id, or None if it doesn't
+        arrive within timeout seconds. Raises if the worker replied with an error.
+        """
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        finally:
+            self.discard(correlation_id)
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures) + len(self._streams)
+
+    def _on_reply(self, ch, method, properties, body):
+        correlation_id = getattr(properties, 'correlation_id', None)
+        headers = getattr(properties, 'headers', None) or {}
+        with self._lock:
+            future = self._futures.pop(correlation_id, None)
+            replies = self._streams.get(correlation_id)
+        if replies is not None:
+            if headers.get('error'):
+                replies.put(RuntimeError(headers['error']))
+            else:
+                replies.put((body.decode('utf-8'), headers))
+            return
+        if future is None:
+            # The handler already timed out, or the reply isn't ours
+            logger.warning("Dropping reply with unknown correlation id: %s", correlation_id)
+            return
+        future.headers = headers
+        if headers.get('error'):
+            future.set_exception(RuntimeError(headers['error']))
+        else:
+            future.set_result(body.decode('utf-8'))
+
+    def _fail_pending(self, error):
+        # Replies for the old, exclusive reply queue are lost with the connection
+        with self._lock:
+            futures, self._futures = self._futures, {}
+            streams, self._streams = self._streams, {}
+        for future in futures.values():
+            future.set_exception(error)
+        for replies in streams.values():
+            replies.put(error)
+
+    def _run(self):
+        while self._running:
+            connection = None
+            try:
+                connection = self.connection_factory()
+                channel = connection.channel()
+                result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+                self._reply_queue = result.method.queue
+                channel.basic_consume(queue=self._reply_queue, on_message_callback=self._on_reply,
+                                      auto_ack=True)
+                self._ready.set()
+                logger.info("RPC reply consumer listening on %s", self._reply_queue)
+                while self._running:
+                    connection.process_data_events(time_limit=self.poll_interval)
+            except Exception as e:
+                logger.error("Error in RPC reply consumer: %s", e)
+                self._fail_pending(ConnectionError("RPC reply consumer disconnected: %s" % e))
+                time.sleep(self.reconnect_delay)
+            finally:
+                self._ready.clear()
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,262 @@
+"""
+Pluggable file storage for the Flask backend.
+
+The app used to fork `hdfs dfs -put` / `hdfs dfs -cat` for every upload and
+CSV download, paying a JVM start (1-3 s) each time. The backends here keep a
+persistent in-process client instead and stream data in both directions:
+
+    webhdfs  - WebHDFS REST API over a keep-alive requests.Session (default)
+    pyarrow  - libhdfs through pyarrow.fs.HadoopFileSystem
+    local    - a directory on the local filesystem, for running without a cluster
+    cli      - the old `hdfs dfs` commands, fed through stdin/stdout
+
+Every backend exposes put(fileobj, path), read_chunks(path), exists(path),
+is_dir(path) and list_files(path). read_merged_csv() turns a directory of
+Spark CSV part files into a single CSV stream.
+"""
+import logging
+import os
+import shutil
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageFileNotFound(StorageError):
+    pass
+
+
+class WebHdfsStorage:
+    def __init__(self, base_url, user=None, timeout=30):
+        import requests
+
+        self.base_url = base_url.rstrip('/') + '/webhdfs/v1'
+        self.user = user
+        self.timeout = timeout
+        # One keep-alive session so uploads don't pay a TCP handshake each time
+        self.session = requests.Session()
+
+    def _url(self, path):
+        return self.base_url + '/' + path.lstrip('/')
+
+    def _params(self, op, **params):
+        params['op'] = op
+        if self.user:
+            params['user.name'] = self.user
+        return params
+
+    def put(self, fileobj, path):
+        # CREATE is a two-step operation: the namenode redirects to a datanode
+        response = self.session.put(self._url(path), params=self._params('CREATE', overwrite='true'),
+                                    allow_redirects=False, timeout=self.timeout)
+        if response.status_code != 307:
+            raise StorageError("WebHDFS CREATE %s failed: %s %s" % (path, response.status_code, response.text))
+        response = self.session.put(response.headers['Location'], data=fileobj, timeout=self.timeout)
+        if response.status_code != 201:
+            raise StorageError("WebHDFS upload of %s failed: %s %s" % (path, response.status_code, response.text))
+
+    def read_chunks(self, path, chunk_size=CHUNK_SIZE):
+        response = self.session.get(self._url(path), params=self._params('OPEN'),
+                                    stream=True, timeout=self.timeout)
+        if response.status_code == 404:
+            response.close()
+            raise StorageFileNotFound(path)
+        if response.status_code != 200:
+            response.close()
+            raise StorageError("WebHDFS OPEN %s failed: %s" % (path, response.status_code))
+
+        def chunks():
+            with response:
+                for chunk in response.iter_content(chunk_size):
+                    yield chunk
+        return chunks()
+
+    def exists(self, path):
+        response = self.session.get(self._url(path), params=self._params('GETFILESTATUS'),
+                                    timeout=self.timeout)
+        return response.status_code == 200
+
+    def is_dir(self, path):
+        response = self.session.get(self._url(path), params=self._params('GETFILESTATUS'),
+                                    timeout=self.timeout)
+        return response.status_code == 200 and response.json()['FileStatus']['type'] == 'DIRECTORY'
+
+    def list_files(self, path):
+        response = self.session.get(self._url(path), params=self._params('LISTSTATUS'),
+                                    timeout=self.timeout)
+        if response.status_code == 404:
+            raise StorageFileNotFound(path)
+        if response.status_code != 200:
+            raise StorageError("WebHDFS LISTSTATUS %s failed: %s" % (path, response.status_code))
+        return [path.rstrip('/') + '/' + status['pathSuffix']
+                for status in response.json()['FileStatuses']['FileStatus']
+                if status['type'] == 'FILE']
+
+
+class PyArrowHdfsStorage:
+    def __init__(self, host, port=9000, user=None):
+        from pyarrow import fs
+
+        self.fs = fs
+        self.hdfs = fs.HadoopFileSystem(host, port, user=user)
+
+    def put(self, fileobj, path):
+        with self.hdfs.open_output_stream(path) as out:
+            shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+
+    def read_chunks(self, path, chunk_size=CHUNK_SIZE):
+        if not self.exists(path):
+            raise StorageFileNotFound(path)
+        stream = self.hdfs.open_input_stream(path)
+
+        def chunks():
+            with stream:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def exists(self, path):
+        return self.hdfs.get_file_info(path).type != self.fs.FileType.NotFound
+
+    def is_dir(self, path):
+        return self.hdfs.get_file_info(path).type == self.fs.FileType.Directory
+
+    def list_files(self, path):
+        infos = self.hdfs.get_file_info(self.fs.FileSelector(path))
+        return [info.path for info in infos if info.type == self.fs.FileType.File]
+
+
+class LocalStorage:
+    """Maps HDFS-style absolute paths onto a directory on the local disk."""
+    def __init__(self, root):
+        self.root = root
+
+    def _local(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def put(self, fileobj, path):
+        local_path = self._local(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as out:
+            shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+
+    def read_chunks(self, path, chunk_size=CHUNK_SIZE):
+        try:
+            f = open(self._local(path), 'rb')
+        except FileNotFoundError:
+            raise StorageFileNotFound(path)
+
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def exists(self, path):
+        return os.path.exists(self._local(path))
+
+    def is_dir(self, path):
+        return os.path.isdir(self._local(path))
+
+    def list_files(self, path):
+        try:
+            names = os.listdir(self._local(path))
+        except FileNotFoundError:
+            raise StorageFileNotFound(path)
+        return [path.rstrip('/') + '/' + name for name in names
+                if os.path.isfile(os.path.join(self._local(path), name))]
+
+
+class CliHdfsStorage:
+    """The original `hdfs dfs` behaviour, kept as a fallback."""
+    def put(self, fileobj, path):
+        process = subprocess.Popen(['hdfs', 'dfs', '-put', '-f', '-', path],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        shutil.copyfileobj(fileobj, process.stdin, CHUNK_SIZE)
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            raise StorageError(stderr.decode())
+
+    def read_chunks(self, path, chunk_size=CHUNK_SIZE):
+        if not self.exists(path):
+            raise StorageFileNotFound(path)
+        process = subprocess.Popen(['hdfs', 'dfs', '-cat', path], stdout=subprocess.PIPE)
+
+        def chunks():
+            with process:
+                while True:
+                    chunk = process.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def exists(self, path):
+        return subprocess.run(['hdfs', 'dfs', '-test', '-e', path]).returncode == 0
+
+    def is_dir(self, path):
+        return subprocess.run(['hdfs', 'dfs', '-test', '-d', path]).returncode == 0
+
+    def list_files(self, path):
+        result = subprocess.run(['hdfs', 'dfs', '-ls', '-C', path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise StorageFileNotFound(path)
+        return [line for line in result.stdout.decode().splitlines()
+                if line and subprocess.run(['hdfs', 'dfs', '-test', '-f', line]).returncode == 0]
+
+
+def read_merged_csv(storage, path, chunk_size=CHUNK_SIZE):
+    """
+    Streams path as one CSV. A plain file is streamed as is; a directory
+    written by Spark is streamed as the concatenation of its part-*.csv files
+    in name order, keeping only the first part's header line.
+    """
+    if not storage.is_dir(path):
+        return storage.read_chunks(path, chunk_size)
+    parts = sorted(p for p in storage.list_files(path)
+                   if os.path.basename(p).startswith('part-') and p.endswith('.csv'))
+    if not parts:
+        raise StorageFileNotFound(path)
+
+    def chunks():
+        for i, part in enumerate(parts):
+            skip_header = i > 0
+            for chunk in storage.read_chunks(part, chunk_size):
+                if skip_header:
+                    newline = chunk.find(b'\n')
+                    if newline < 0:
+                        continue
+                    chunk = chunk[newline + 1:]
+                    skip_header = False
+                if chunk:
+                    yield chunk
+    return chunks()
+
+
+def storage_from_env():
+    backend = os.getenv('STORAGE_BACKEND', 'webhdfs')
+    user = os.getenv('HDFS_USER', 'almalinux')
+    logger.info("Using '%s' storage backend", backend)
+    if backend == 'webhdfs':
+        return WebHdfsStorage(os.getenv('WEBHDFS_URL', 'http://management:9870'), user=user)
+    if backend == 'pyarrow':
+        return PyArrowHdfsStorage(os.getenv('HDFS_HOST', 'management'),
+                                  int(os.getenv('HDFS_PORT', '9000')), user=user)
+    if backend == 'local':
+        return LocalStorage(os.getenv('LOCAL_STORAGE_ROOT', 'local_hdfs'))
+    if backend == 'cli':
+        return CliHdfsStorage()
+    raise ValueError("Unknown STORAGE_BACKEND: %s" % backend)
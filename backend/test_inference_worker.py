@@ -0,0 +1,167 @@
+"""
+InferenceWorker against the in-process FakeBroker (local_fakes.py).
+
+    cd backend && python -m pytest -q test_inference_worker.py
+"""
+import json
+import threading
+
+import pika
+import pytest
+
+from inference_worker import InferenceWorker, EXCHANGE_NAME, REQUEST_ROUTING_KEY, RESPONSE_QUEUE
+from local_fakes import FakeBroker
+
+
+class RecordingPredictor:
+    """Scores each path by its trailing number / 10; 'bad' paths fail to load."""
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, images):
+        self.batches.append(list(images))
+        return [ValueError("cannot decode " + image) if 'bad' in image
+                else int(image.rsplit('_', 1)[1]) / 10.0 for image in images]
+
+
+class FailingPredictor:
+    def predict(self, images):
+        raise RuntimeError("model exploded")
+
+
+@pytest.fixture
+def broker():
+    return FakeBroker()
+
+
+def publish(broker, body, correlation_id=None, reply_to=None):
+    if not isinstance(body, str):
+        body = json.dumps(body)
+    properties = pika.BasicProperties(correlation_id=correlation_id, reply_to=reply_to)
+    broker.publish(EXCHANGE_NAME, REQUEST_ROUTING_KEY, body, properties)
+
+
+def run_worker(broker, predictor, queues, count, **kwargs):
+    """
+    Runs a worker over whatever has been published and returns the first
+    `count` replies found on `queues` as (queue, properties, body).
+    """
+    worker = InferenceWorker(broker.connection(), predictor, **kwargs)
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    replies = []
+    try:
+        while len(replies) < count:
+            assert broker.wait(queues, timeout=5), "only %d of %d replies arrived" % (len(replies), count)
+            for queue in queues:
+                method, properties, body = broker.pop(queue)
+                if method is not None:
+                    replies.append((queue, properties, body))
+    finally:
+        worker.stop()
+        thread.join(timeout=5)
+    return worker, replies
+
+
+def declare(broker):
+    """Binds request_queue before anything is published, like a worker that is already up."""
+    InferenceWorker(broker.connection(), None).declare_topology()
+    for queue in ('reply_a', 'reply_b'):
+        broker.declare(queue)
+
+
+def test_replies_follow_correlation_id_and_reply_to(broker):
+    declare(broker)
+    publish(broker, {'filename': 'a', 'hdfs_path': '/img_2'}, 'id-a', 'reply_a')
+    publish(broker, {'filename': 'b', 'hdfs_path': '/img_8'}, 'id-b', 'reply_b')
+    publish(broker, {'filename': 'c', 'hdfs_path': '/img_5'}, 'id-c')
+
+    _, replies = run_worker(broker, RecordingPredictor(), ['reply_a', 'reply_b', RESPONSE_QUEUE], 3)
+
+    by_id = {properties.correlation_id: (queue, properties, body) for queue, properties, body in replies}
+    assert by_id['id-a'][0] == 'reply_a' and by_id['id-a'][2] == b'0'
+    assert float(by_id['id-a'][1].headers['raw_prediction']) == 0.2
+    assert by_id['id-b'][0] == 'reply_b' and by_id['id-b'][2] == b'1'
+    # No reply_to: the reply goes to the shared response queue
+    assert by_id['id-c'][0] == RESPONSE_QUEUE and by_id['id-c'][2] == b'1'
+    assert all('inference_seconds' in properties.headers for _, properties, _ in replies)
+
+
+def test_reply_headers_can_be_encoded_by_pika(broker):
+    # The fake encodes published properties, so a header pika cannot send fails here too
+    declare(broker)
+    publish(broker, {'filename': 'a', 'hdfs_path': '/img_7'}, 'single', 'reply_a')
+    publish(broker, {'images': [{'filename': 'b', 'hdfs_path': '/img_3'}]}, 'batch', 'reply_a')
+
+    _, replies = run_worker(broker, RecordingPredictor(), ['reply_a'], 2)
+
+    by_id = {properties.correlation_id: properties for _, properties, _ in replies}
+    assert by_id['single'].headers['raw_prediction'] == '0.7'
+    for properties in by_id.values():
+        properties.encode()
+        assert float(properties.headers['inference_seconds']) >= 0
+
+
+def test_requests_in_the_same_window_share_a_forward_pass(broker):
+    declare(broker)
+    for i in range(5):
+        publish(broker, {'filename': str(i), 'hdfs_path': '/img_%d' % i}, 'id-%d' % i, 'reply_a')
+    predictor = RecordingPredictor()
+
+    worker, replies = run_worker(broker, predictor, ['reply_a'], 5, batch_window=0.05, max_batch_size=3)
+
+    assert [len(batch) for batch in predictor.batches] == [3, 2]
+    assert worker.batches == 2 and worker.requests == 5
+    assert sorted(properties.correlation_id for _, properties, _ in replies) == ['id-%d' % i for i in range(5)]
+    assert len(broker.acked) == 5
+
+
+def test_batch_request_gets_one_reply_per_chunk_and_one_ack(broker):
+    declare(broker)
+    images = [{'filename': str(i), 'hdfs_path': '/img_%d' % i} for i in range(5)]
+    publish(broker, {'images': images}, 'batch', 'reply_a')
+
+    _, replies = run_worker(broker, RecordingPredictor(), ['reply_a'], 3, max_batch_size=2)
+
+    chunks = [json.loads(body) for _, _, body in replies]
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    entries = [entry for chunk in chunks for entry in chunk]
+    assert [entry['index'] for entry in entries] == [0, 1, 2, 3, 4]
+    assert [entry['hdfs_path'] for entry in entries] == ['/img_%d' % i for i in range(5)]
+    assert all(properties.headers['batch_size'] == 5 for _, properties, _ in replies)
+    # Acked once, only after the last chunk has been answered
+    assert len(broker.acked) == 1
+
+
+def test_error_replies(broker):
+    declare(broker)
+    publish(broker, 'not json', 'malformed', 'reply_a')
+    publish(broker, {'filename': 'x', 'hdfs_path': '/bad_1'}, 'unreadable', 'reply_a')
+    publish(broker, {'images': [{'filename': 'ok', 'hdfs_path': '/img_9'},
+                                {'filename': 'x', 'hdfs_path': '/bad_2'}]}, 'mixed', 'reply_a')
+
+    _, replies = run_worker(broker, RecordingPredictor(), ['reply_a'], 3)
+
+    by_id = {properties.correlation_id: (properties, body) for _, properties, body in replies}
+    properties, body = by_id['malformed']
+    assert body == b'' and 'error' in properties.headers
+    properties, body = by_id['unreadable']
+    assert body == b'' and 'cannot decode' in properties.headers['error']
+    ok, bad = json.loads(by_id['mixed'][1])
+    assert ok['Result'] == '1' and ok['msg'] is None
+    assert bad['Result'] is None and 'cannot decode' in bad['msg']
+    assert len(broker.acked) == 3
+
+
+def test_failed_forward_pass_answers_every_request(broker):
+    declare(broker)
+    publish(broker, {'filename': 'a', 'hdfs_path': '/img_1'}, 'single', 'reply_a')
+    publish(broker, {'images': [{'filename': 'b', 'hdfs_path': '/img_2'}]}, 'batch', 'reply_a')
+
+    _, replies = run_worker(broker, FailingPredictor(), ['reply_a'], 2)
+
+    by_id = {properties.correlation_id: (properties, body) for _, properties, body in replies}
+    assert by_id['single'][0].headers['error'] == "model exploded"
+    assert json.loads(by_id['batch'][1])[0]['msg'] == "model exploded"
+    assert len(broker.acked) == 2
+
@@ -0,0 +1,117 @@
+"""
+Model tuning progress messages for a backend running as several processes.
+
+Every process binds its own exclusive, server-named queue to the tuning
+routing key, so each one hears every message published while it is up and
+can update its in-memory state (on_update). Only one process, the leader,
+also consumes the shared durable queue, with an exclusive consumer that
+RabbitMQ grants to a single connection at a time; it runs on_leader_message
+(persisting, and emitting to the clients of every process through the
+Socket.IO message queue). The other processes retry every `leader_retry`
+seconds, so one of them takes over within that time if the leader goes away.
+
+The durable queue also holds whatever was published while no process was
+up, which only the leader drains. So the leader republishes every message it
+handles on `sync_routing_key`, which every private queue is bound to as
+well: each process then applies the backlog too, and a message published
+while they were all up is simply applied twice.
+
+The loop never blocks for long in pika, so under eventlet/gevent (with
+monkey patching) it cooperates with the request handlers.
+"""
+import logging
+import time
+
+import pika.exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class TuningConsumer:
+    def __init__(self, connection_factory, exchange, queue, routing_key, on_update, on_leader_message,
+                 poll_interval=1.0, leader_retry=5.0, reconnect_delay=2.0, sleep=time.sleep,
+                 sync_routing_key=None):
+        """
+        on_update(message) / on_leader_message(message) take the decoded body;
+        on_update must be safe to run twice for the same message.
+        sleep: how to wait between reconnects, e.g. socketio.sleep.
+        sync_routing_key: where the leader republishes; routing_key + '_sync' by default.
+        """
+        self.connection_factory = connection_factory
+        self.exchange = exchange
+        self.queue = queue
+        self.routing_key = routing_key
+        self.sync_routing_key = sync_routing_key or routing_key + '_sync'
+        self.on_update = on_update
+        self.on_leader_message = on_leader_message
+        self.poll_interval = poll_interval
+        self.leader_retry = leader_retry
+        self.reconnect_delay = reconnect_delay
+        self.sleep = sleep
+        self.is_leader = False
+        self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def _declare(self, channel):
+        channel.exchange_declare(exchange=self.exchange, exchange_type='direct')
+        channel.queue_declare(queue=self.queue, durable=True)
+        channel.queue_bind(exchange=self.exchange, queue=self.queue, routing_key=self.routing_key)
+
+    def _on_update(self, ch, method, properties, body):
+        message = body.decode('utf-8')
+        logger.info("Received RabbitMQ message: %s", message)
+        self.on_update(message)
+
+    def _on_leader_message(self, ch, method, properties, body):
+        self.on_leader_message(body.decode('utf-8'))
+        # Hands the message to every process, including those that missed it while down
+        ch.basic_publish(exchange=self.exchange, routing_key=self.sync_routing_key, body=body)
+
+    def _try_lead(self, connection):
+        # A refused exclusive consume closes the channel, so each attempt gets a new one
+        channel = connection.channel()
+        try:
+            channel.basic_consume(queue=self.queue, on_message_callback=self._on_leader_message,
+                                  auto_ack=True, exclusive=True)
+        except pika.exceptions.ChannelClosedByBroker as e:
+            logger.debug("Another process is consuming %s: %s", self.queue, e)
+            return False
+        logger.info("This process is now the consumer of %s", self.queue)
+        return True
+
+    def run(self):
+        self._running = True
+        while self._running:
+            connection = None
+            try:
+                connection = self.connection_factory()
+                channel = connection.channel()
+                self._declare(channel)
+                result = channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+                for routing_key in (self.routing_key, self.sync_routing_key):
+                    channel.queue_bind(exchange=self.exchange, queue=result.method.queue,
+                                       routing_key=routing_key)
+                channel.basic_consume(queue=result.method.queue, on_message_callback=self._on_update,
+                                      auto_ack=True)
+                logger.info("RabbitMQ consumer started, waiting for messages.")
+
+                next_attempt = 0.0
+                while self._running:
+                    if not self.is_leader and time.monotonic() >= next_attempt:
+                        self.is_leader = self._try_lead(connection)
+                        next_attempt = time.monotonic() + self.leader_retry
+                    connection.process_data_events(time_limit=self.poll_interval)
+            except Exception as e:
+                logger.error("Error in RabbitMQ consumer: %s", e)
+                if self._running:
+                    self.sleep(self.reconnect_delay)
+            finally:
+                # The broker drops our exclusive consumer with the connection
+                self.is_leader = False
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
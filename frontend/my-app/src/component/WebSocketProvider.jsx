@@ -67,6 +67,12 @@ export const WebSocketProvider = ({ children }) => {
                 console.log("Received update message:", msg);
                 setMessage(msg.message);
             });
+            // Full state, pushed on connect and after every change
+            socket.on("state", (state) => {
+                setMessage(state.message);
+                setButtonEnabled(state.buttonEnabled);
+                setPageActive(state.pageActive);
+            });
 
             // cleanup
             return () => {
@@ -74,6 +80,7 @@ export const WebSocketProvider = ({ children }) => {
                 socket.off("disconnect");
                 socket.off("rabbitmq_message");
                 socket.off("update_message");
+                socket.off("state");
                 socket.disconnect();
             };
         };